@@ -168,13 +168,20 @@ def generate_fake_samples(generator, latent_dim, n_samples):
 	y = label2mat(labels_input)
 	return images, y
 
-def label2mat(label, nr_cls=11):
-	matl = np.zeros((len(label),nr_cls))
-	for i in range(len(label)):
-		matl[i,int(label[i])] = 1
-	return matl
+# the identity matrices used as one-hot lookup tables, one per number of classes
+_identity = {}
+
+def label2mat(label, nr_cls=11, dtype=np.float32):
+	key = (nr_cls, np.dtype(dtype))
+	if not key in _identity:
+		_identity[key] = np.eye(nr_cls, dtype=dtype)
+	return _identity[key][np.asarray(label).astype(np.intp).reshape(-1)]
  
  # train the generator and discriminator
+# this ResNet trainer does not run: define_discriminator uses fe before it is defined and adds feature maps of different
+# sizes, define_gan expects a generator with a label input and labels_input is never defined. It is left without the
+# checkpoints, tf.data sampling and step metrics of CGAN.train, the maintained trainer, and keeps its full evaluate and
+# predict of every epoch instead of the sampled evaluation and JSON lines log of CGAN.train
 def train(g_model, d_model, gan_model, dataset, latent_dim, tdataset, n_epochs=5, n_batch=128):
 	bat_per_epo = int(dataset[0].shape[0] / n_batch)
 	half_batch = int(n_batch / 2)
@@ -16,7 +16,10 @@ from tensorflow.keras.layers import LeakyReLU
 from tensorflow.keras.layers import Dropout
 from tensorflow.keras.layers import Embedding
 from tensorflow.keras.layers import Concatenate
+from tensorflow.keras.layers import UpSampling2D
+from tensorflow.keras.layers import Cropping2D
 import numpy as np
+import tensorflow as tf
 import preprocessing
 import featureExtr
 # import sklearn
@@ -25,9 +28,51 @@ from sklearn.metrics import recall_score, accuracy_score, precision_score
 import matplotlib.pyplot as plt
 import itertools
 import time
+import json
+from trainMetrics import MetricsRecorder
+from trainMetrics import truncate_log
+from trainCheckpoint import TrainCheckpoint
+
+# mean squared error against the one-hot targets, computed from the integer labels: (sum(p^2) - 2*p[label] + 1) / nr. classes
+def sparse_mse(y_true, y_pred):
+	label = tf.cast(tf.reshape(y_true, [-1]), tf.int32)
+	p_label = tf.gather(y_pred, label, axis=1, batch_dims=1)
+	return (tf.reduce_sum(tf.square(y_pred), axis=-1) - 2 * p_label + 1) / tf.cast(tf.shape(y_pred)[-1], y_pred.dtype)
+
+# the losses computed from the integer labels, the one-hot targets are never built
+SPARSE_LOSSES = {'sparse_mse': sparse_mse, 'sparse_categorical_crossentropy': 'sparse_categorical_crossentropy'}
+
+def get_loss(loss):
+	return SPARSE_LOSSES.get(loss, loss) if isinstance(loss, str) else loss
+
+# True if the model is trained on the integer labels instead of the one-hot targets
+def is_sparse(model):
+	loss = model.loss if isinstance(model.loss, str) else getattr(model.loss, '__name__', '')
+	return loss in SPARSE_LOSSES
+
+# dropout with the masks drawn from its own tf.random.Generator: the generator state is saved in the training checkpoints
+# (not in the .h5 weights), so a resumed run draws the same masks as an uninterrupted one. The generator is split from
+# tf.random.Generator.from_seed(seed), so its stream differs from the one of a training generator with that seed; without a
+# seed, the seed is drawn from the NumPy global generator (seeded by tf.keras.utils.set_random_seed)
+@tf.keras.utils.register_keras_serializable(package='CGAN')
+class StatefulDropout(Dropout):
+	def __init__(self, rate, noise_shape=None, seed=None, **kwargs):
+		super().__init__(rate, noise_shape=noise_shape, seed=seed, **kwargs)
+		self.rng = tf.random.Generator.from_seed(np.random.randint(2**31) if seed is None else seed).split(1)[0]
+
+	def call(self, inputs, training=None):
+		if training is None:
+			training = tf.keras.backend.learning_phase()
+		def dropped():
+			keep = tf.cast(self.rng.uniform(tf.shape(inputs)) >= self.rate, inputs.dtype)
+			return inputs * keep / (1 - self.rate)
+		if tf.is_tensor(training):
+			return tf.cond(tf.cast(training, tf.bool), dropped, lambda: tf.identity(inputs))
+		return dropped() if training else inputs
 
 # define the standalone discriminator model
-def define_discriminator(in_shape=(62,62,1), n_classes=11, conv_layers = [128, 128], dropout = 0.4, fact_fnc = 'relu', loss = 'mse', metrics = 'accuracy'):
+# seed: the seed of the dropout masks (see StatefulDropout)
+def define_discriminator(in_shape=(62,62,1), n_classes=11, conv_layers = [128, 128], dropout = 0.4, fact_fnc = 'relu', loss = 'mse', metrics = 'accuracy', lr = 0.0002, seed=None):
 	# label input
 	in_label = Input(shape=(1,))
 	# embedding for categorical input
@@ -50,66 +95,102 @@ def define_discriminator(in_shape=(62,62,1), n_classes=11, conv_layers = [128, 1
 	# flatten feature maps
 	fe = Flatten()(fe)
 	# dropout
-	fe = Dropout(dropout)(fe)
+	fe = StatefulDropout(dropout, seed=seed)(fe)
 	# output
 	out_layer = Dense(n_classes, activation=fact_fnc)(fe)
 	# define model
 	model = Model([in_image, in_label], out_layer)
 	# compile model
-	opt = Adam(lr=0.0002, beta_1=0.5)
-	model.compile(loss=loss, optimizer=opt, metrics=[metrics])
+	opt = Adam(lr=lr, beta_1=0.5)
+	model.compile(loss=get_loss(loss), optimizer=opt, metrics=[metrics])
 	return model
 
+# crop the feature maps (or images) of size x size to target x target, or to target = (height, width)
+def crop_to(x, size, target):
+	height, width = (target, target) if np.ndim(target) == 0 else target
+	if size == height and size == width:
+		return x
+	crop_h, crop_w = size - height, size - width
+	return Cropping2D(((crop_h // 2, crop_h - crop_h // 2), (crop_w // 2, crop_w - crop_w // 2)))(x)
+
 # define the standalone generator model
-def define_generator(latent_dim, n_classes=11):
+# stem: how the latent vector becomes the seed_size x seed_size x base_channels feature maps
+#	'dense' - one Dense layer, latent_dim * base_channels * seed_size^2 weights
+#	'lowrank' - a Dense layer factorized through rank units, (latent_dim + base_channels * seed_size^2) * rank weights
+#	'progressive' - a Dense layer to 4x4 feature maps, bilinearly upsampled and convolved until seed_size is reached (the
+#		nearest neighbour gradient has no XLA kernel)
+# out_size: the size of the generated square image, or its (height, width), ex. the shape of the psd features
+def define_generator(latent_dim, n_classes=11, base_channels=128, seed_size=31, stem='dense', rank=64, out_size=62, out_kernel=31):
+	if not stem in ['dense', 'lowrank', 'progressive']:
+		raise ValueError("Unknown generator stem: %s" % stem)
 	# label input
 	in_label = Input(shape=(1,))
 	# embedding for categorical input
 	li = Embedding(n_classes, 62)(in_label)
 	# linear multiplication
-	n_nodes = 31 * 31
+	n_nodes = seed_size * seed_size
 	li = Dense(n_nodes)(li)
 	# reshape to additional channel
-	li = Reshape((31,31, 1))(li)
+	li = Reshape((seed_size, seed_size, 1))(li)
 	# image generator input
 	in_lat = Input(shape=(latent_dim,))
-	# foundation for 7x7 image
-	n_nodes = 128 * 31 * 31
-	gen = Dense(n_nodes)(in_lat)
-	gen = LeakyReLU(alpha=0.2)(gen)
-	gen = Reshape((31, 31, 128))(gen)
+	# foundation for the seed_size x seed_size image
+	if stem == 'progressive':
+		size = 4
+		gen = Dense(base_channels * size * size)(in_lat)
+		gen = LeakyReLU(alpha=0.2)(gen)
+		gen = Reshape((size, size, base_channels))(gen)
+		while size < seed_size:
+			gen = UpSampling2D(interpolation='bilinear')(gen)
+			gen = Conv2D(base_channels, (3,3), padding='same')(gen)
+			gen = LeakyReLU(alpha=0.2)(gen)
+			size = size * 2
+		gen = crop_to(gen, size, seed_size)
+	else:
+		gen = in_lat
+		if stem == 'lowrank':
+			gen = Dense(rank, use_bias=False)(gen)
+		gen = Dense(base_channels * seed_size * seed_size)(gen)
+		gen = LeakyReLU(alpha=0.2)(gen)
+		gen = Reshape((seed_size, seed_size, base_channels))(gen)
 	# merge image gen and label input
 	merge = Concatenate()([gen, li])
-	# upsample to 14x14
-	gen = Conv2DTranspose(128, (4,4), strides=(1,1), padding='same')(merge)
-	gen = LeakyReLU(alpha=0.2)(gen)
-	# upsample to 28x28
-	gen = Conv2DTranspose(128, (4,4), strides=(2,2), padding='same')(gen)
+	gen = Conv2DTranspose(base_channels, (4,4), strides=(1,1), padding='same')(merge)
 	gen = LeakyReLU(alpha=0.2)(gen)
+	# upsample until the image is at least as large as out_size, then crop it
+	size = seed_size
+	while size < np.max(out_size):
+		gen = Conv2DTranspose(base_channels, (4,4), strides=(2,2), padding='same')(gen)
+		gen = LeakyReLU(alpha=0.2)(gen)
+		size = size * 2
+	gen = crop_to(gen, size, out_size)
 	# output
-	out_layer = Conv2D(1, (31,31), activation='tanh', padding='same')(gen)
+	out_layer = Conv2D(1, (out_kernel,out_kernel), activation='tanh', padding='same')(gen)
 	# define model
 	model = Model([in_lat, in_label], out_layer)
 	return model
 
 # define the combined generator and discriminator model, for updating the generator
-def define_gan(g_model, d_model, loss = 'mse', metrics = 'accuracy'):
+def define_gan(g_model, d_model, loss = 'mse', metrics = 'accuracy', lr = 0.0002):
 	# make weights in the discriminator not trainable
 	d_model.trainable = False
 	# get noise and label inputs from generator model
 	gen_noise, gen_label = g_model.input
 	# get image output from the generator model
 	gen_output = g_model.output
+	if tuple(gen_output.shape[1:]) != tuple(d_model.input[0].shape[1:]):
+		raise ValueError("The generator output %s doesn't match the discriminator input %s, build the generator with "
+			"out_size = (height, width) of the features" % (tuple(gen_output.shape[1:]), tuple(d_model.input[0].shape[1:])))
 	# connect image output and label input from generator as inputs to discriminator
 	gan_output = d_model([gen_output, gen_label])
 	# define gan model as taking noise and label and outputting a classification
 	model = Model([gen_noise, gen_label], gan_output)
 	# compile model
-	opt = Adam(lr=0.0002, beta_1=0.5)
-	model.compile(loss=loss, optimizer=opt, metrics = [metrics])
+	opt = Adam(lr=lr, beta_1=0.5)
+	model.compile(loss=get_loss(loss), optimizer=opt, metrics = [metrics])
 	return model
 
-def generate_real_samples(dataset, n_samples):
+def generate_real_samples(dataset, n_samples, sparse=False):
 	# split into images and labels
 	images, labels = dataset
 	# choose random instances
@@ -117,90 +198,223 @@ def generate_real_samples(dataset, n_samples):
 	# select images and labels
 	X, labels = images[ix], labels[ix]
 	# generate class labels
-	y = label2mat(labels)
+	y = encode_targets(labels, sparse)
 	return [X, labels], y
 
+# build the tf.data pipeline of shuffled 'real' batches, prepared in parallel with the training step
+def make_real_dataset(dataset, n_samples, n_classes=11, seed=None, sparse=False):
+	# split into images and labels, kept on the device once
+	images, labels = dataset
+	images = tf.constant(np.asarray(images, dtype=np.float32))
+	labels = tf.constant(np.reshape(labels, (-1, 1)).astype(np.int32))
+	# shuffle the indexes only, every pass over the dataset in a new order
+	ds = tf.data.Dataset.range(images.shape[0])
+	ds = ds.shuffle(images.shape[0], seed=seed, reshuffle_each_iteration=True).repeat()
+	ds = ds.batch(n_samples, drop_remainder=True)
+	# select images and labels and generate the one-hot (or integer) class labels, yields [X, labels], y
+	def select(ix):
+		X, label = tf.gather(images, ix), tf.gather(labels, ix)
+		return (X, label), (label if sparse else tf.one_hot(label[:,0], n_classes))
+	ds = ds.map(select, num_parallel_calls=tf.data.AUTOTUNE)
+	return ds.prefetch(tf.data.AUTOTUNE)
+
 # generate points in latent space as input for the generator
 def generate_latent_points(latent_dim, n_samples, n_classes=11):
 	# generate points in the latent space
 	x_input = randn(latent_dim * n_samples)
 	# reshape into a batch of inputs for the network
 	z_input = x_input.reshape(n_samples, latent_dim)
-	# generate labels
-	labels = randint(0, n_classes, n_samples)
+	# generate labels, one column as the labels of the dataset
+	labels = randint(0, n_classes, (n_samples, 1))
 	return [z_input, labels]
 
 # use the generator to generate n fake examples, with class labels
-def generate_fake_samples(generator, latent_dim, n_samples):
+def generate_fake_samples(generator, latent_dim, n_samples, sparse=False):
 	# generate points in latent space
 	z_input, labels_input = generate_latent_points(latent_dim, n_samples)
 	# predict outputs
 	images = generator.predict([z_input, labels_input])
 	# create class labels
-	y = label2mat(labels_input)
+	y = encode_targets(labels_input, sparse)
 	return [images, labels_input], y
 
-def label2mat(label, nr_cls=11):
-	matl = np.zeros((len(label),nr_cls))
-	for i in range(len(label)):
-		matl[i,int(label[i])] = 1
-	return matl
+# build the compiled training step: generates the fakes and updates the discriminator and the generator in one graph call
+def make_train_step(g_model, d_model, gan_model, latent_dim, n_classes=11, rng=None, jit_compile=False):
+	# the discriminator weights, frozen in the gan model but updated by its own optimizer
+	d_model.trainable = True
+	d_vars = d_model.trainable_variables
+	d_model.trainable = False
+	g_vars = g_model.trainable_variables
+	d_opt = d_model.optimizer
+	g_opt = gan_model.optimizer
+	loss_fn = tf.keras.losses.get(d_model.loss)
+	sparse = is_sparse(d_model)
+	if rng is None:
+		rng = tf.random.Generator.from_non_deterministic_state()
+
+	def targets(labels):
+		return labels if sparse else tf.one_hot(labels[:,0], n_classes)
+
+	def d_update(X, labels, y):
+		with tf.GradientTape() as tape:
+			d_loss = tf.reduce_mean(loss_fn(y, d_model([X, labels], training=True)))
+		d_opt.apply_gradients(zip(tape.gradient(d_loss, d_vars), d_vars))
+		return d_loss
+
+	@tf.function(jit_compile=jit_compile)
+	def train_step(X_real, labels_real, y_real):
+		n_samples = tf.shape(X_real)[0]
+		# update discriminator model weights on the 'real' samples
+		d_loss1 = d_update(X_real, tf.cast(labels_real, tf.int32), y_real)
+		# generate 'fake' examples and update discriminator model weights
+		z_input = rng.normal((n_samples, latent_dim))
+		labels = rng.uniform((n_samples, 1), 0, n_classes, dtype=tf.int32)
+		X_fake = g_model([z_input, labels], training=False)
+		d_loss2 = d_update(X_fake, labels, targets(labels))
+		# update the generator via the discriminator's error, on a full batch
+		z_input = rng.normal((2 * n_samples, latent_dim))
+		labels_input = rng.uniform((2 * n_samples, 1), 0, n_classes, dtype=tf.int32)
+		y_gan = targets(labels_input)
+		with tf.GradientTape() as tape:
+			predict = d_model([g_model([z_input, labels_input], training=True), labels_input], training=True)
+			g_loss = tf.reduce_mean(loss_fn(y_gan, predict))
+		g_opt.apply_gradients(zip(tape.gradient(g_loss, g_vars), g_vars))
+		acc = tf.reduce_mean(tf.cast(tf.equal(tf.argmax(predict, axis=1, output_type=tf.int32), labels_input[:,0]), tf.float32))
+		return d_loss1, d_loss2, g_loss, acc
+
+	return train_step
+
+# the identity matrices used as one-hot lookup tables, one per number of classes
+_identity = {}
+
+def label2mat(label, nr_cls=11, dtype=np.float32):
+	key = (nr_cls, np.dtype(dtype))
+	if not key in _identity:
+		_identity[key] = np.eye(nr_cls, dtype=dtype)
+	return _identity[key][np.asarray(label).astype(np.intp).reshape(-1)]
+
+# the targets of the labels: the integer labels for the sparse losses, the one-hot matrix otherwise
+def encode_targets(label, sparse=False, nr_cls=11):
+	if sparse:
+		return np.asarray(label).astype(np.int32).reshape(-1, 1)
+	return label2mat(label, nr_cls)
  
+# loss and accuracy of the discriminator in one batched forward pass, on all the samples or on a random subset of n_samples
+def evaluate_discriminator(d_model, dataset, n_samples=None, batch_size=1024, seed=None):
+	images, labels = dataset
+	labels = np.asarray(labels).astype(np.int32).reshape(-1)
+	idx = np.arange(len(labels))
+	if not(n_samples is None) and n_samples < len(labels):
+		# sorted, so a memory-mapped dataset is read in order
+		idx = np.sort(np.random.default_rng(seed).choice(len(labels), n_samples, replace=False))
+	loss_fn = tf.keras.losses.get(d_model.loss)
+	sparse = is_sparse(d_model)
+	loss_sum = 0.0
+	correct = 0
+	# stream the samples batch by batch, every batch is used for the loss and the accuracy
+	for start in range(0, len(idx), batch_size):
+		ix = idx[start:start+batch_size]
+		label = labels[ix]
+		predict = d_model([np.asarray(images[ix], dtype=np.float32), label.reshape(-1, 1)], training=False)
+		loss_sum += float(tf.reduce_sum(loss_fn(encode_targets(label, sparse), predict)))
+		correct += int(np.sum(np.argmax(predict, axis=1) == label))
+	return loss_sum / len(idx), correct / len(idx)
+
+# append the record to the JSON lines log file, or print it as one JSON line if there is no log file
+def log_record(record, log_file=None):
+	line = json.dumps(record)
+	if log_file is None:
+		print(line)
+	else:
+		with open(log_file, 'a') as f:
+			f.write(line + '\n')
+
  # train the generator and discriminator
-def train(g_model, d_model, gan_model, dataset, latent_dim, tdataset, n_epochs=5, n_batch=128):
+def train(g_model, d_model, gan_model, dataset, latent_dim, tdataset, n_epochs=5, n_batch=128, use_tfdata=True, compiled=True, jit_compile=False,
+		eval_every=1, eval_samples=None, eval_batch=1024, log_file=None, metrics_file=None, metrics_fmt='jsonl',
+		checkpoint_dir=None, checkpoint_every=1, max_to_keep=3, seed=None):
+	# the train and test sets are evaluated every eval_every epochs (and after the last one), on eval_samples random
+	# samples of each (all if None); the history of the other epochs is NaN. The metrics of every step are written to
+	# metrics_file by a background thread (see trainMetrics.MetricsRecorder). With a checkpoint_dir, the training state is
+	# saved every checkpoint_every epochs (the last max_to_keep are kept) and a new call resumes from the latest checkpoint.
+	# The seed sets the order of the 'real' batches and the random generator of the training step; with the discriminator
+	# seed (define_discriminator), the NumPy and TensorFlow global seeds and deterministic ops, a run is reproducible and
+	# a resumed run ends with the same weights as an uninterrupted one (None draws it from the NumPy global generator)
 	bat_per_epo = int(dataset[0].shape[0] / n_batch)
 	half_batch = int(n_batch / 2)
-	history = np.zeros((2, n_epochs))
-	history_batch = np.zeros((2, n_batch, n_epochs))
-	thistory = np.zeros((2, n_epochs))
+	history = np.full((2, n_epochs), np.nan)
+	thistory = np.full((2, n_epochs), np.nan)
+	recorder = MetricsRecorder(n_epochs, bat_per_epo, n_batch, metrics_file, metrics_fmt)
+	sparse = is_sparse(d_model)
+	# sample the 'real' batches with tf.data, prefetched while the models train
+	if use_tfdata:
+		real_samples = iter(make_real_dataset(dataset, half_batch, seed=seed, sparse=sparse))
+	# one compiled graph call per batch instead of the three train_on_batch calls
+	rng = tf.random.Generator.from_seed(np.random.randint(2**31) if seed is None else seed)
+	if compiled:
+		train_step = make_train_step(g_model, d_model, gan_model, latent_dim, rng=rng, jit_compile=jit_compile)
+	# restore the models, optimizers, random generators, data iterator, counters and history of the latest checkpoint
+	first_epoch = 0
+	if not(checkpoint_dir is None):
+		objects = {'generator': g_model, 'discriminator': d_model, 'd_optimizer': d_model.optimizer,
+			'g_optimizer': gan_model.optimizer, 'rng': rng}
+		if use_tfdata:
+			objects['real_samples'] = real_samples
+		ckpt = TrainCheckpoint(checkpoint_dir, max_to_keep, **objects)
+		state = ckpt.restore()
+		if not(state is None):
+			first_epoch = int(state['epoch'])
+			if state['history'].shape != history.shape:
+				raise ValueError("The checkpoint in %s is of a run with %d epochs, not n_epochs = %d" %
+					(checkpoint_dir, state['history'].shape[1], n_epochs))
+			history[:], thistory[:] = state['history'], state['thistory']
+			recorder.load_state(state, first_epoch)
+		# the epochs and steps logged after the checkpoint by a run that crashed are logged again
+		recorder.truncate(first_epoch)
+		if not(log_file is None):
+			truncate_log(log_file, first_epoch)
 	# manually enumerate epochs
-	for i in range(n_epochs):
+	for i in range(first_epoch, n_epochs):
+		epoch_start = time.time()
 		# enumerate batches over the training set
 		for j in range(bat_per_epo):
-			start = time.time()
+			recorder.start()
 			# get randomly selected 'real' samples
-			[X_real, labels_real], y_real = generate_real_samples(dataset, half_batch)
-			# update discriminator model weights
-			d_loss1, _ = d_model.train_on_batch([X_real, labels_real], y_real)
-			# generate 'fake' examples
-			
-			[X_fake, labels], y_fake = generate_fake_samples(g_model, latent_dim, half_batch)
-			# update discriminator model weights
-			d_loss2, _ = d_model.train_on_batch([X_fake, labels], y_fake)
-			# prepare points in latent space as input for the generator
-			[z_input, labels_input] = generate_latent_points(latent_dim, n_batch)
-			# print("************")
-			# print(z_input.shape)
-			# create inverted labels for the fake samples
-			y_gan = label2mat(labels_input)
-			#y_gan = ones((n_batch, 1))
-			# update the generator via the discriminator's error
-			g_loss, acc = gan_model.train_on_batch([z_input, labels_input], y_gan)
-			history_batch[0,j,i] = g_loss
-			history_batch[1,j,i] = acc
-			# summarize loss on this batch
-			print('>%d/%d, %d/%d, d1=%.3f, d2=%.3f g=%.3f ----- acc: %.3f' %
-				(i+1,n_epochs, j+1,bat_per_epo, d_loss1, d_loss2, g_loss, acc))
-			end = time.time()
-			print("Timpul:")
-			print(end - start)
-
-		images, labels = dataset
-		y = label2mat(labels)
-		history[0][i], history[1][i] = d_model.evaluate(dataset,y)
-		# print("##### Train dataset id: \n")
-		# print(dataset)
-		print('>>%d/%d, Tain loss: %.3f, Train acc: %.3f'%(n_epochs, i+1, history[0][i], history[1][i]))
-
-		timages, tlabels = tdataset
-		y = label2mat(tlabels)
-		thistory[0][i],thistory[1][i] = d_model.evaluate(tdataset,y)
-		predict = d_model.predict(tdataset)
-		print("##### Test dataset predict: \n")
-		print(predict)
-		print('>>%d/%d, Test loss: %.3f, Test acc: %.3f'%(n_epochs, i+1, thistory[0][i], thistory[1][i]))
-
-	return history,thistory,history_batch
+			if use_tfdata:
+				[X_real, labels_real], y_real = next(real_samples)
+			else:
+				[X_real, labels_real], y_real = generate_real_samples(dataset, half_batch, sparse)
+			if compiled:
+				d_loss1, d_loss2, g_loss, acc = [float(v) for v in train_step(X_real, labels_real, y_real)]
+			else:
+				# update discriminator model weights
+				d_loss1, _ = d_model.train_on_batch([X_real, labels_real], y_real)
+				# generate 'fake' examples
+				[X_fake, labels], y_fake = generate_fake_samples(g_model, latent_dim, half_batch, sparse)
+				# update discriminator model weights
+				d_loss2, _ = d_model.train_on_batch([X_fake, labels], y_fake)
+				# prepare points in latent space as input for the generator
+				[z_input, labels_input] = generate_latent_points(latent_dim, n_batch)
+				# create inverted labels for the fake samples
+				y_gan = encode_targets(labels_input, sparse)
+				# update the generator via the discriminator's error
+				g_loss, acc = gan_model.train_on_batch([z_input, labels_input], y_gan)
+			recorder.record(i, j, d_loss1, d_loss2, g_loss, acc)
+
+		record = {'epoch': i+1, 'n_epochs': n_epochs, **recorder.epoch_summary(i), 'train_time': time.time() - epoch_start}
+		if (i+1) % eval_every == 0 or i+1 == n_epochs:
+			eval_start = time.time()
+			history[0][i], history[1][i] = evaluate_discriminator(d_model, dataset, eval_samples, eval_batch, seed=i)
+			thistory[0][i], thistory[1][i] = evaluate_discriminator(d_model, tdataset, eval_samples, eval_batch, seed=i)
+			record.update({'train_loss': history[0][i], 'train_acc': history[1][i], 'test_loss': thistory[0][i],
+				'test_acc': thistory[1][i], 'eval_time': time.time() - eval_start})
+		log_record(record, log_file)
+		if not(checkpoint_dir is None) and ((i+1) % checkpoint_every == 0 or i+1 == n_epochs):
+			recorder.flush(wait=True)
+			ckpt.save(i+1, epoch=i+1, step=(i+1)*bat_per_epo, history=history, thistory=thistory, **recorder.state())
+
+	recorder.close()
+	return history,thistory,recorder.history_batch()
 
 def save_plot(examples, n, name):
 	# plot images
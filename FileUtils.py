@@ -2,6 +2,7 @@ import numpy as np
 import re
 import os
 import mne
+from concurrent.futures import ThreadPoolExecutor
 
 """
 This FileUtils.py module contains:
@@ -10,12 +11,28 @@ load_data - load data into a dictionary [X, y]
 
 find_number - find the number after a specific string in text
 
+read_segment_store - read all the trials of one subject from a .npz store
+
+read_fif_record - read one trial from a .raw.fif file
+
+file_subject - returns the subject of a segmented DataBase file
+
 create_input file - create the X and y files for NN input
 
 split - splits data intro train and test with a rate of train_nr
 
 split_kfold - splits the data set X into k folds
 
+class_ranks - groups the observations by class and ranks them randomly inside every class
+
+split_indexes - splits the observations indexes into train and test
+
+kfold_indexes - generates the train and test indexes of every fold
+
+load_subjects - load the subject index table saved by create_input_file
+
+loso_indexes - generates the train and test indexes of every leave-one-subject-out fold
+
 """
 
 def find_number(text, c):
@@ -30,39 +47,155 @@ def find_number(text, c):
 	"""
 	return re.findall(r'%s(\d+)' % c, text)
 
-def create_input_file(data_path, drop_ch):
+def read_segment_store(filename, drop_ch):
+	""" This function read all the trials of one subject from a .npz store written by segmentation.save_segment_store
+
+		Input data:
+			filename - the name of the .npz store
+			drop_ch - the channel that wants to be droped
+
+		Output data:
+			trials - list with the signal of every trial. Dimension of one trial: [nr. channels x nr. samples]
+			tags - the tag of every trial
+
+	"""
+	store = np.load(filename)
+	ch_names = list(store['ch_names'])
+	index = store['index']
+
+	picks = [ch for ch,name in enumerate(ch_names) if name not in drop_ch][:-2]
+	samples = store['samples'][picks]
+
+	trials = [samples[:,start:stop] for start,stop in index[:,:2]]
+
+	return trials, index[:,2]
+
+def read_fif_record(filename, drop_ch):
+	""" This function read one trial from a .raw.fif file and keep the 62 EEG channels and the samples used as NN input
+
+		Input data:
+			filename - the name of the .raw.fif file
+			drop_ch - the channel that wants to be droped
+
+		Output data:
+			sgn - the trial signal. Dimension: [62 x 4000]
+			tag - the trial tag, taken from the file name
+
+	"""
+	EEG_data = mne.io.read_raw_fif(filename, preload = True)
+	EEG_data.drop_channels(drop_ch)
+	tag = find_number(os.path.basename(filename),'tag')
+
+	sgn = EEG_data[:][0]
+	sgn = sgn[:-2]
+
+	return sgn[:,500:4500], tag
+
+def file_subject(filename):
+	"""
+	This function returns the subject of a segmented DataBase file
+
+	Input data:
+		filename - the name of a .raw.fif trial file (imagined_speech_<subject>_<trial>_tag<tag>.raw.fif) or of a .npz
+			store (imagined_speech_<subject>.npz). The tag can be written as a float, ex. tag3.0
+
+	Output data:
+		The subject name
+	"""
+	match = re.match(r'imagined_speech_(.+?)(?:_\d+_tag|\.npz$)', os.path.basename(filename))
+	if match is None:
+		raise ValueError("Can't find the subject in the file name: %s" % filename)
+
+	return match.group(1)
+
+def create_input_file(data_path, drop_ch, fmt = 'fif', save_path = None, n_jobs = 1, dtype = np.float32):
 	""" This function take all the signals from da DataBase and put them into an X amtrix with corresponding y tag
 
 		Input data: 
 			data_path - the path of the DataBase
 			drop_ch - the channel that wants to be droped
+			fmt - 'fif' if the DataBase contains one .raw.fif file per trial, 'npz' if the DataBase contains one .npz store
+				per subject (see segmentation.data_segmentation). DEFAULT = 'fif'
+			save_path - the folder where the X and y files will be saved. If None, the current folder is used. DEFAULT = None
+			n_jobs - the number of threads used to read the files. DEFAULT = 1
+			dtype - the data type of the saved X array. DEFAULT = np.float32
 
 		Output data:
-			The X and y array will be saved
+			The X and y array will be saved as KaraOne_EEGSpeech_X.npy and KaraOne_EEGSpeech_y.npy
+			The subject index table will be saved as KaraOne_EEGSpeech_subjects.npz (see load_subjects)
+
+		The X array is never held in memory: it is preallocated on disk with np.lib.format.open_memmap and every record is
+		written straight into its slot. It can be opened later without copying with load_data(..., mmap_mode = 'r').
 
+		The files are sorted by name before reading and every file has a fixed slot in X, so the records order is the same
+		on every filesystem and for every n_jobs.
 	"""
-	text_file = [f for f in os.listdir(data_path) if f.endswith('.raw.fif')]
+	if fmt != 'fif' and fmt != 'npz':
+		raise ValueError("It's not a valid file format!")
+
+	if save_path is None:
+		save_path = os.getcwd()
+
+	if fmt == 'npz':
+		text_file = sorted(f for f in os.listdir(data_path) if f.startswith('imagined_speech_') and f.endswith('.npz'))
+		n_trials = [len(np.load(os.path.join(data_path, file))['index']) for file in text_file]
+	else:
+		text_file = sorted(f for f in os.listdir(data_path) if f.endswith('.raw.fif'))
+		n_trials = [1]*len(text_file)
 
-	n_rec = len(text_file)
-	X = np.zeros((n_rec,62,4000))
+	slots = np.concatenate(([0], np.cumsum(n_trials))).astype(int)
+	n_rec = slots[-1]
+
+	file_subjects = [file_subject(file) for file in text_file]
+	names = sorted(set(file_subjects))
+	subject = np.repeat([names.index(name) for name in file_subjects], n_trials).astype(int)
+
+	X = np.lib.format.open_memmap(os.path.join(save_path, 'KaraOne_EEGSpeech_X.npy'), mode = 'w+', dtype = dtype, shape = (n_rec,62,4000))
 	y = np.zeros((n_rec,1))
 
-	for file,rec in zip(text_file,range(len(text_file))):
-		data_file = data_path + '\\' + file
-		EEG_data = mne.io.read_raw_fif(data_file, preload = True)
-		EEG_data.drop_channels(drop_ch)
-		tag = find_number(file,'tag')
-	    
-		sgn = EEG_data[:][0]
-		sgn = sgn[:-2]
-	    
-		X[rec,:,:] = sgn[:,500:4500]
-		y[rec] = tag
-
-	np.save(r'KaraOne_EEGSpeech_X',X)
-	np.save(r'KaraOne_EEGSpeech_y',y)
-
-def load_data(xname, yname, path = None):
+	def load_file(file, rec):
+		if fmt == 'npz':
+			trials, tags = read_segment_store(os.path.join(data_path, file), drop_ch)
+			for i in range(len(trials)):
+				X[rec+i,:,:] = trials[i][:,500:4500]
+				y[rec+i] = tags[i]
+		else:
+			X[rec,:,:], y[rec] = read_fif_record(os.path.join(data_path, file), drop_ch)
+
+	if n_jobs == 1:
+		for file,rec in zip(text_file,slots[:-1]):
+			load_file(file, rec)
+	else:
+		with ThreadPoolExecutor(max_workers = n_jobs) as executor:
+			futures = [executor.submit(load_file, file, rec) for file,rec in zip(text_file,slots[:-1])]
+			for future in futures:
+				future.result()
+
+	X.flush()
+	del X
+
+	np.save(os.path.join(save_path, 'KaraOne_EEGSpeech_y'),y)
+	np.savez(os.path.join(save_path, 'KaraOne_EEGSpeech_subjects'), names = np.asarray(names), subject = subject)
+
+def load_subjects(path = None, name = 'KaraOne_EEGSpeech_subjects.npz'):
+	"""
+	This function load the subject index table saved by create_input_file
+
+	Input data:
+		path - the path of the table. DEFAULT = None
+		name - the name of the table. DEFAULT = 'KaraOne_EEGSpeech_subjects.npz'
+
+	Output data:
+		names - the subjects names
+		subject - the index in names of the subject of every record. Dimension: [nr. records]
+	"""
+	if(path):
+		name = os.path.join(path, name)
+
+	with np.load(name) as table:
+		return list(table['names']), table['subject']
+
+def load_data(xname, yname, path = None, mmap_mode = None):
 	"""
 	This function load the x and y data with name xname and yname from path
 
@@ -70,6 +203,8 @@ def load_data(xname, yname, path = None):
 		xname - the name of x file
 		yname - the name of y file
 		path - the path of x nd y file. DEFAULT = None
+		mmap_mode - None, 'r', 'r+' or 'c'. If not None, the files are memory-mapped with np.load(..., mmap_mode) and only
+			the slices used later are read from disk. DEFAULT = None
 
 	Output data:
 		x - loaded x file
@@ -77,13 +212,13 @@ def load_data(xname, yname, path = None):
 
 	"""
 	if(path):
-		path_x = path + '/'+ xname
-		path_y = path + '/' + y_name
-		x = np.load(path_x)
-		y = np.load(path_y)
+		path_x = os.path.join(path, xname)
+		path_y = os.path.join(path, yname)
+		x = np.load(path_x, mmap_mode = mmap_mode)
+		y = np.load(path_y, mmap_mode = mmap_mode)
 	else:
-		x = np.load(xname)
-		y = np.load(yname)
+		x = np.load(xname, mmap_mode = mmap_mode)
+		y = np.load(yname, mmap_mode = mmap_mode)
 
 	return [x, y]
 
@@ -321,10 +456,119 @@ def split_kfold(X, y, k=5, flag = 0, nr_cls = None, indexes = 0):
 		return X_train, y_train, X_test, y_test
 
 
+def class_ranks(y, seed = None):
+	"""
+	This function groups the observations by class and ranks them randomly inside every class
+
+	Input data:
+		y - target data. Dimension: [nr. observations] or [nr. observations x 1]
+		seed - the seed of the random permutation. DEFAULT = None
+
+	Output data:
+		idx - the observations indexes, grouped by class and randomly permuted inside every class
+		rank - the rank of every observation from idx inside its class
+		count - the number of observations of the class of every observation from idx
+	"""
+	y = np.ravel(y)
+	rnd = np.random.default_rng(seed).permutation(len(y))
+
+	order = np.argsort(y[rnd], kind='stable')
+	idx = rnd[order]
+
+	cls, start, count = np.unique(y[idx], return_index=True, return_counts=True)
+	rank = np.arange(len(idx)) - np.repeat(start, count)
+
+	return idx, rank, np.repeat(count, count)
+
+def split_indexes(y, test_nr = 0.2, flag = 0, seed = None):
+	"""
+	This function splits the observations indexes into train and test with a rate of test_nr. It is the index-only
+	version of split: X is not copied and can be indexed later, ex. a memory-mapped X[idxtrain].
+
+	Input data:
+		y - target data. Dimension: [nr. observations] or [nr. observations x 1]
+		test_nr - the percentage of test data divided by 100. DEFAULT = 0.2 (20%)
+		flag - is 0 or 1, if flag is 0 the split doesn't regard the class distribution, if flag is 1 every class is split
+			with the rate test_nr. DEFAULT = 0
+		seed - the seed of the random permutation. DEFAULT = None
+
+	Output data:
+		idxtrain - the sorted indexes of the train observations
+		idxtest - the sorted indexes of the test observations
+	"""
+	if(flag!= 0 and flag!=1):
+		raise ValueError("It's not a valid flag number")
+
+	if flag==1:
+		idx, rank, count = class_ranks(y, seed)
+		test = rank >= count - (count*test_nr).astype(int)
+	else:
+		idx = np.random.default_rng(seed).permutation(len(y))
+		test = np.arange(len(idx)) >= len(idx) - int(len(idx)*test_nr)
+
+	return np.sort(idx[~test]), np.sort(idx[test])
+
+def kfold_indexes(y, k = 5, flag = 0, seed = None):
+	"""
+	This function generates the train and test indexes of every fold. It is the index-only version of split_kfold: the
+	folds are not copied and X can be indexed lazily, ex. a memory-mapped X[idxtrain].
+
+	Input data:
+		y - target data. Dimension: [nr. observations] or [nr. observations x 1]
+		k - the number of folds. DEFAULT = 5
+		flag - can have values of 0 or 1. When flag is 1, every class is split equally between the folds, when flag is 0,
+			the observations are split randomly without considering the classes. DEFAULT = 0
+		seed - the seed of the random permutation. DEFAULT = None
+
+	Output data:
+		For every fold, yields:
+			idxtrain - the sorted indexes of the train observations
+			idxtest - the sorted indexes of the test observations
+
+	The test sets of the k folds are disjoint. Every fold has floor(nr. observations/k) test observations (of every class if
+	flag is 1); the remaining observations are always in train.
+	"""
+	if(flag!= 0 and flag!=1):
+		raise ValueError("It's not a valid flag number")
+
+	if flag==1:
+		idx, rank, count = class_ranks(y, seed)
+		nr_fold = count//k
+	else:
+		idx = np.random.default_rng(seed).permutation(len(y))
+		rank = np.arange(len(idx))
+		nr_fold = np.full(len(idx), len(idx)//k)
+
+	fold = np.floor_divide(rank, nr_fold, out=np.full(len(idx), k), where=nr_fold>0)
+
+	for kval in range(k):
+		test = fold == kval
+		yield np.sort(idx[~test]), np.sort(idx[test])
+
 def split_leaveOneOut(x, y, idxtrain, idxtest):
 	xtrain = np.concatenate((x[idxtrain[0]:idxtrain[1]],x[idxtrain[2]:idxtrain[3]]), axis=0)
 	ytrain = np.concatenate((y[idxtrain[0]:idxtrain[1]],y[idxtrain[2]:idxtrain[3]]), axis=0)
 	xtest = x[idxtest[0]:idxtest[1]]
 	ytest = y[idxtest[0]:idxtest[1]]
 
-	return xtrain, ytrain, xtest, ytest
\ No newline at end of file
+	return xtrain, ytrain, xtest, ytest
+
+def loso_indexes(subject, names = None):
+	"""
+	This function generates the train and test indexes of every leave-one-subject-out fold
+
+	Input data:
+		subject - the subject of every record, ex. from load_subjects. Dimension: [nr. records]
+		names - the subjects names. If None, the subjects are named by their index. DEFAULT = None
+
+	Output data:
+		For every subject, yields:
+			name - the name of the test subject
+			idxtrain - the indexes of the records of all the other subjects
+			idxtest - the indexes of the records of the test subject
+	"""
+	subject = np.ravel(subject)
+
+	for s in np.unique(subject):
+		test = subject == s
+		yield (s if names is None else names[s]), np.flatnonzero(~test), np.flatnonzero(test)
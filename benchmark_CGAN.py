@@ -0,0 +1,216 @@
+import time
+import argparse
+import numpy as np
+import tensorflow as tf
+import CGAN
+
+"""
+This benchmark module measures the training speed of the CGAN on random data with the shape of the covariance features:
+
+	python benchmark_CGAN.py [--steps N] [--n_batch N] [--latent_dim N] [--generator NAME] [--jit] [--generators]
+
+Every training mode runs on new models with the same weights initialization and reports the steps per second and the
+seconds per step. The models use the CGAN.define_generator defaults, or the GENERATORS configuration --generator:
+
+	train_on_batch - the three Keras train_on_batch calls per step (CGAN.train with compiled = False)
+	tf.function - the compiled training step (CGAN.make_train_step)
+	tf.function + XLA - the compiled training step with jit_compile = True (only with --jit)
+
+With --generators, the generator configurations of GENERATORS are compared instead: number of parameters, FLOPs of one
+generated image and steps per second of the compiled training step.
+
+This module contains:
+
+build_models - creates the discriminator, generator and gan models
+
+generator_flops - computes the FLOPs of the generator for one image
+
+bench_train_on_batch - measures the train_on_batch training step
+
+bench_train_step - measures the compiled training step
+
+bench_generators - compares the generator configurations
+
+"""
+
+# (name, latent_dim, define_generator parameters)
+GENERATORS = [
+	('dense 1000', 1000, {}),
+	('dense 100', 100, {}),
+	('lowrank 1000 r64', 1000, {'stem': 'lowrank', 'rank': 64}),
+	('dense 100 seed 8', 100, {'seed_size': 8}),
+	('progressive 100', 100, {'stem': 'progressive', 'base_channels': 64}),
+	('progressive 100 k5', 100, {'stem': 'progressive', 'base_channels': 64, 'out_kernel': 5}),
+]
+
+def build_models(in_shape, latent_dim, seed = 0, generator = {}):
+	"""
+	This function creates the discriminator, generator and gan models
+
+	Input data:
+		in_shape - the shape of the discriminator input
+		latent_dim - the dimension of the latent space
+		seed - the seed of the weights initialization. DEFAULT = 0
+		generator - the parameters of CGAN.define_generator. DEFAULT = {}
+
+	Output data:
+		g_model, d_model, gan_model - the models
+	"""
+	tf.random.set_seed(seed)
+	d_model = CGAN.define_discriminator(in_shape = in_shape)
+	g_model = CGAN.define_generator(latent_dim, **generator)
+	gan_model = CGAN.define_gan(g_model, d_model)
+
+	return g_model, d_model, gan_model
+
+def generator_flops(g_model):
+	"""
+	This function computes the FLOPs of the generator for one image, from the shapes of the Dense and convolution layers
+
+	Input data:
+		g_model - the generator model
+
+	Output data:
+		The number of floating point operations (2 per multiply-add) of one forward pass
+	"""
+	macs = 0
+	for layer in g_model.layers:
+		if isinstance(layer, tf.keras.layers.Dense):
+			macs += np.prod(layer.input_shape[1:]) * layer.units
+		elif isinstance(layer, tf.keras.layers.Conv2DTranspose):
+			# every input pixel is multiplied by the whole kernel
+			h, w, c = layer.input_shape[1:]
+			macs += h * w * c * np.prod(layer.kernel_size) * layer.filters
+		elif isinstance(layer, tf.keras.layers.Conv2D):
+			h, w, c = layer.output_shape[1:3] + layer.input_shape[3:]
+			macs += h * w * c * np.prod(layer.kernel_size) * layer.filters
+
+	return 2 * int(macs)
+
+def bench_train_on_batch(models, dataset, latent_dim, n_batch, steps, warmup = 3):
+	"""
+	This function measures the train_on_batch training step
+
+	Input data:
+		models - g_model, d_model, gan_model
+		dataset - the train data [images, labels]
+		latent_dim - the dimension of the latent space
+		n_batch - the batch size
+		steps - the number of measured steps
+		warmup - the number of steps run before the measurement. DEFAULT = 3
+
+	Output data:
+		The number of steps per second
+	"""
+	g_model, d_model, gan_model = models
+	half_batch = int(n_batch / 2)
+
+	def step():
+		[X_real, labels_real], y_real = CGAN.generate_real_samples(dataset, half_batch)
+		d_model.train_on_batch([X_real, labels_real], y_real)
+		[X_fake, labels], y_fake = CGAN.generate_fake_samples(g_model, latent_dim, half_batch)
+		d_model.train_on_batch([X_fake, labels], y_fake)
+		[z_input, labels_input] = CGAN.generate_latent_points(latent_dim, n_batch)
+		gan_model.train_on_batch([z_input, labels_input], CGAN.label2mat(labels_input))
+
+	for i in range(warmup):
+		step()
+
+	start = time.perf_counter()
+	for i in range(steps):
+		step()
+
+	return steps / (time.perf_counter() - start)
+
+def bench_train_step(models, dataset, latent_dim, n_batch, steps, warmup = 3, jit_compile = False):
+	"""
+	This function measures the compiled training step
+
+	Input data:
+		models - g_model, d_model, gan_model
+		dataset - the train data [images, labels]
+		latent_dim - the dimension of the latent space
+		n_batch - the batch size
+		steps - the number of measured steps
+		warmup - the number of steps run before the measurement, the first one traces the graph. DEFAULT = 3
+		jit_compile - if True, the step is compiled with XLA. DEFAULT = False
+
+	Output data:
+		The number of steps per second
+	"""
+	g_model, d_model, gan_model = models
+	train_step = CGAN.make_train_step(g_model, d_model, gan_model, latent_dim, jit_compile = jit_compile)
+	real_samples = iter(CGAN.make_real_dataset(dataset, int(n_batch / 2)))
+
+	def step():
+		[X_real, labels_real], y_real = next(real_samples)
+		# read the losses back, as CGAN.train does, so the step is finished when it is timed
+		return [float(v) for v in train_step(X_real, labels_real, y_real)]
+
+	for i in range(warmup):
+		step()
+
+	start = time.perf_counter()
+	for i in range(steps):
+		step()
+
+	return steps / (time.perf_counter() - start)
+
+def bench_generators(in_shape, dataset, n_batch, steps):
+	"""
+	This function compares the generator configurations of GENERATORS
+
+	Input data:
+		in_shape - the shape of the discriminator input
+		dataset - the train data [images, labels]
+		n_batch - the batch size
+		steps - the number of measured steps
+
+	Output data:
+		The list of (name, nr. parameters, FLOPs per image, steps per second)
+	"""
+	results = []
+	for name, latent_dim, generator in GENERATORS:
+		models = build_models(in_shape, latent_dim, generator = generator)
+		results.append((name, models[0].count_params(), generator_flops(models[0]),
+			bench_train_step(models, dataset, latent_dim, n_batch, steps)))
+
+	return results
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = 'Measure the training speed of the CGAN.')
+	parser.add_argument('--steps', type = int, default = 20, help = 'the number of measured steps')
+	parser.add_argument('--n_batch', type = int, default = 128, help = 'the batch size')
+	parser.add_argument('--latent_dim', type = int, default = 1000, help = 'the dimension of the latent space')
+	parser.add_argument('--n_samples', type = int, default = 1024, help = 'the number of random train samples')
+	parser.add_argument('--jit', action = 'store_true', help = 'also measure the XLA compiled training step')
+	parser.add_argument('--generator', default = None, choices = [name for name, latent_dim, generator in GENERATORS],
+		help = 'the generator configuration used to compare the training modes (its latent_dim replaces --latent_dim)')
+	parser.add_argument('--generators', action = 'store_true', help = 'compare the generator configurations')
+	args = parser.parse_args()
+
+	in_shape = (62, 62, 1)
+	rng = np.random.default_rng(0)
+	dataset = [rng.standard_normal((args.n_samples,) + in_shape, dtype = np.float32), rng.integers(0, 11, (args.n_samples, 1))]
+
+	latent_dim, generator = args.latent_dim, {}
+	for name, g_latent_dim, g_params in GENERATORS:
+		if name == args.generator:
+			latent_dim, generator = g_latent_dim, g_params
+
+	if args.generators:
+		print('%-20s %12s %12s %10s' % ('generator', 'params', 'MFLOPs', 'steps/s'))
+		for name, params, flops, speed in bench_generators(in_shape, dataset, args.n_batch, args.steps):
+			print('%-20s %12d %12.1f %10.2f' % (name, params, flops / 1e6, speed))
+	else:
+		results = [('train_on_batch', bench_train_on_batch(build_models(in_shape, latent_dim, generator = generator), dataset,
+			latent_dim, args.n_batch, args.steps))]
+		results.append(('tf.function', bench_train_step(build_models(in_shape, latent_dim, generator = generator), dataset,
+			latent_dim, args.n_batch, args.steps)))
+		if args.jit:
+			results.append(('tf.function + XLA', bench_train_step(build_models(in_shape, latent_dim, generator = generator), dataset,
+				latent_dim, args.n_batch, args.steps, jit_compile = True)))
+
+		print('%-20s %10s %10s %8s' % ('mode', 'steps/s', 's/step', 'speedup'))
+		for name, speed in results:
+			print('%-20s %10.4f %10.3f %7.2fx' % (name, speed, 1 / speed, speed / results[0][1]))
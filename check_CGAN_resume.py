@@ -0,0 +1,186 @@
+import os
+import json
+import shutil
+import argparse
+import tempfile
+import numpy as np
+import tensorflow as tf
+import CGAN
+from trainCheckpoint import TrainCheckpoint
+
+"""
+This check module verifies that a CGAN training run that crashes and is resumed from its last checkpoint ends with the
+same weights and logs as an uninterrupted run, on random data with the shape of the covariance features:
+
+	python check_CGAN_resume.py [--n_epochs N] [--crash_epoch N] [--n_batch N] [--n_samples N] [--train_on_batch]
+
+Both runs use the same seeds and deterministic ops. The crashed run stops when it saves the checkpoint of crash_epoch,
+before the checkpoint is written, so it is resumed from the checkpoint of the previous epoch. The weights of the
+generator and the discriminator, the train and test history and the rows of the epoch and step logs (without the
+timings) of the two runs must be equal.
+
+This module contains:
+
+build_models - creates small discriminator, generator and gan models with a seed
+
+crash_at - makes TrainCheckpoint.save raise before the checkpoint of an epoch is written, as a crash would
+
+run - trains the models with checkpoints, crashing and resuming the run if crash_epoch is set
+
+read_log - reads the rows of a JSON lines log without the timings
+
+compare - compares the weights, the history and the logs of two runs
+
+"""
+
+class Crash(Exception):
+	pass
+
+def build_models(in_shape, latent_dim, seed):
+	"""
+	This function creates small discriminator, generator and gan models with a seed
+
+	Input data:
+		in_shape - the shape of the discriminator input
+		latent_dim - the dimension of the latent space
+		seed - the seed of the NumPy and TensorFlow global generators and of the dropout masks
+
+	Output data:
+		g_model, d_model, gan_model - the models
+	"""
+	tf.keras.utils.set_random_seed(seed)
+	d_model = CGAN.define_discriminator(in_shape = in_shape, conv_layers = [16, 16], seed = seed)
+	g_model = CGAN.define_generator(latent_dim, base_channels = 16, seed_size = 8, stem = 'progressive',
+		out_size = in_shape[:2], out_kernel = 3)
+	gan_model = CGAN.define_gan(g_model, d_model)
+
+	return g_model, d_model, gan_model
+
+def crash_at(epoch):
+	"""
+	This function makes TrainCheckpoint.save raise Crash before the checkpoint of the epoch is written, as a crash would.
+	The next saves are not changed.
+
+	Input data:
+		epoch - the epoch (checkpoint number) of the crash
+	"""
+	save = TrainCheckpoint.save
+
+	def save_or_crash(self, number, **arrays):
+		if number == epoch:
+			TrainCheckpoint.save = save
+			raise Crash()
+		return save(self, number, **arrays)
+
+	TrainCheckpoint.save = save_or_crash
+
+# the fields of the logs that change from run to run
+TIMINGS = ['train_time', 'eval_time', 'step_time', 'samples_per_s']
+
+def read_log(filename):
+	"""
+	This function reads the rows of a JSON lines log without the timings
+
+	Input data:
+		filename - the log file
+
+	Output data:
+		The list of rows (dictionaries)
+	"""
+	with open(filename) as f:
+		return [{name: value for name, value in json.loads(line).items() if not name in TIMINGS} for line in f]
+
+def run(directory, dataset, tdataset, args, crash_epoch = None):
+	"""
+	This function trains the models with checkpoints, crashing and resuming the run if crash_epoch is set
+
+	Input data:
+		directory - the folder of the checkpoints and logs of the run
+		dataset, tdataset - the train and test data [images, labels]
+		args - the command line arguments
+		crash_epoch - the epoch of the crash, None for an uninterrupted run. DEFAULT = None
+
+	Output data:
+		g_model, d_model - the trained models
+		history, thistory - the train and test history
+		log, steps - the rows of the epoch and step logs (see read_log)
+	"""
+	kwargs = dict(n_epochs = args.n_epochs, n_batch = args.n_batch, compiled = not args.train_on_batch,
+		eval_samples = 64, log_file = os.path.join(directory, 'train_log.jsonl'),
+		metrics_file = os.path.join(directory, 'train_steps.jsonl'), checkpoint_dir = os.path.join(directory, 'checkpoints'),
+		seed = args.seed)
+
+	if not(crash_epoch is None):
+		crash_at(crash_epoch)
+		g_model, d_model, gan_model = build_models(dataset[0].shape[1:], args.latent_dim, args.seed)
+		try:
+			CGAN.train(g_model, d_model, gan_model, dataset, args.latent_dim, tdataset, **kwargs)
+			raise RuntimeError("The run did not crash at epoch %d" % crash_epoch)
+		except Crash:
+			pass
+
+	# new models (in a new process after a real crash), restored from the last checkpoint
+	g_model, d_model, gan_model = build_models(dataset[0].shape[1:], args.latent_dim, args.seed)
+	history, thistory, history_batch = CGAN.train(g_model, d_model, gan_model, dataset, args.latent_dim, tdataset, **kwargs)
+
+	return g_model, d_model, history, thistory, read_log(kwargs['log_file']), read_log(kwargs['metrics_file'])
+
+def compare(a, b):
+	"""
+	This function compares the weights, the history and the logs of two runs
+
+	Input data:
+		a, b - the outputs of run
+
+	Output data:
+		The list of (name, largest absolute difference), inf for logs with different rows
+	"""
+	results = []
+	for name, model_a, model_b in [('generator', a[0], b[0]), ('discriminator', a[1], b[1])]:
+		results.append((name, max(float(np.max(np.abs(wa - wb))) for wa, wb in zip(model_a.get_weights(), model_b.get_weights()))))
+	for name, history_a, history_b in [('history', a[2], b[2]), ('thistory', a[3], b[3])]:
+		results.append((name, float(np.nanmax(np.abs(history_a - history_b)))))
+	for name, log_a, log_b in [('train_log rows', a[4], b[4]), ('train_steps rows', a[5], b[5])]:
+		if [sorted(row) for row in log_a] != [sorted(row) for row in log_b]:
+			results.append((name, np.inf))
+		else:
+			results.append((name, max(abs(row_a[field] - row_b[field]) for row_a, row_b in zip(log_a, log_b) for field in row_a)))
+
+	return results
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = 'Check that a crashed and resumed CGAN training equals an uninterrupted one.')
+	parser.add_argument('--n_epochs', type = int, default = 3, help = 'the number of epochs')
+	parser.add_argument('--crash_epoch', type = int, default = 3, help = 'the epoch whose checkpoint is never written')
+	parser.add_argument('--n_batch', type = int, default = 32, help = 'the batch size')
+	parser.add_argument('--n_samples', type = int, default = 256, help = 'the number of random train samples')
+	parser.add_argument('--latent_dim', type = int, default = 16, help = 'the dimension of the latent space')
+	parser.add_argument('--seed', type = int, default = 0, help = 'the seed of the runs')
+	parser.add_argument('--train_on_batch', action = 'store_true', help = 'check the train_on_batch steps (compiled = False)')
+	args = parser.parse_args()
+
+	# deterministic kernels, TF_DETERMINISTIC_OPS before TensorFlow 2.8
+	os.environ['TF_DETERMINISTIC_OPS'] = '1'
+	if hasattr(tf.config.experimental, 'enable_op_determinism'):
+		tf.config.experimental.enable_op_determinism()
+
+	in_shape = (62, 62, 1)
+	rng = np.random.default_rng(args.seed)
+	dataset = [rng.standard_normal((args.n_samples,) + in_shape, dtype = np.float32), rng.integers(0, 11, (args.n_samples, 1))]
+	tdataset = [rng.standard_normal((64,) + in_shape, dtype = np.float32), rng.integers(0, 11, (64, 1))]
+
+	work_dir = tempfile.mkdtemp()
+	try:
+		uninterrupted = run(os.path.join(work_dir, 'uninterrupted'), dataset, tdataset, args)
+		resumed = run(os.path.join(work_dir, 'resumed'), dataset, tdataset, args, crash_epoch = args.crash_epoch)
+	finally:
+		shutil.rmtree(work_dir)
+
+	results = compare(uninterrupted, resumed)
+	print('%-20s %14s' % ('', 'max |diff|'))
+	for name, diff in results:
+		print('%-20s %14.3g' % (name, diff))
+
+	if any(diff != 0 for name, diff in results):
+		raise SystemExit('The resumed run differs from the uninterrupted run')
+	print('The resumed run equals the uninterrupted run')
@@ -0,0 +1,209 @@
+import os
+import hashlib
+import inspect
+import tempfile
+import numpy as np
+
+"""
+This featureCache module contains:
+
+arrayHash - computes the content hash of an array
+
+codeHash - computes the hash of the code of a function and of the functions of its module that it uses
+
+FeatureCache - disk cache for the results of the preprocessing and feature extraction functions
+
+"""
+
+def arrayHash(x, chunk = 64):
+	"""
+	This function computes the content hash of an array
+
+	Input data:
+		x - the array. It can be a memory-mapped array or a strided view
+		chunk - the number of rows of x hashed at once. DEFAULT = 64
+
+	Output data:
+		The hex digest of the dtype, shape and values of x
+	"""
+	x = np.asarray(x)
+	h = hashlib.blake2b(digest_size = 20)
+	h.update(str(x.dtype).encode())
+	h.update(str(x.shape).encode())
+
+	if len(x.shape) == 0:
+		h.update(x.tobytes())
+	else:
+		for start in range(0,x.shape[0],chunk):
+			h.update(np.ascontiguousarray(x[start:start+chunk]).data)
+
+	return h.hexdigest()
+
+def codeHash(func):
+	"""
+	This function computes the hash of the code of a function and of the functions of its module that it uses
+
+	Input data:
+		func - the function
+
+	Output data:
+		The hex digest of the bytecode, constants and names of func, of its inner functions and of the functions of its
+		module that it calls, directly or through other functions. The line numbers are not used, so moving a function in
+		its file keeps its hash.
+	"""
+	h = hashlib.blake2b(digest_size = 20)
+	module = getattr(func, '__module__', None)
+	done = set()
+
+	def update(code, scope):
+		h.update(code.co_code)
+		h.update(repr(code.co_names).encode())
+		for const in code.co_consts:
+			if inspect.iscode(const):
+				update(const, scope)
+			else:
+				h.update(repr(const).encode())
+		for name in code.co_names:
+			value = scope.get(name)
+			if inspect.isfunction(value) and value.__module__ == module and not name in done:
+				done.add(name)
+				update(value.__code__, value.__globals__)
+
+	if inspect.isfunction(func):
+		done.add(func.__name__)
+		update(func.__code__, func.__globals__)
+
+	return h.hexdigest()
+
+class FeatureCache:
+	"""
+	This class is a disk cache for the results of the preprocessing and feature extraction functions
+
+	Input data:
+		path - the folder of the cache files. DEFAULT = 'feature_cache'
+		max_bytes - the size budget of the cache. When it is exceeded, the least recently used results are deleted.
+			DEFAULT = 10 GB
+		version - a string added to every key. Change it to recompute the results after a change that codeHash does not
+			see, ex. a library update. DEFAULT = ''
+
+	A result is keyed by the function name, the hash of its code (codeHash), the content hash of every array argument and
+	the repr of every other argument, so changing one parameter only recomputes the functions that receive it or the arrays
+	computed from it, and changing a function recomputes its results. The results are saved as .npz files, written in
+	temporary files with unique names, so several processes can share the cache.
+
+	Example:
+		cache = FeatureCache()
+		xtrain = cache.run(featureExtr.chConv, xtrain, dtype = np.float32)
+	"""
+	def __init__(self, path = 'feature_cache', max_bytes = 10*2**30, version = ''):
+		self.path = path
+		self.max_bytes = max_bytes
+		self.version = version
+		self.codes = {}
+		self.hits = 0
+		self.misses = 0
+
+		if not os.path.isdir(path):
+			os.makedirs(path)
+
+	def key(self, func, args, kwargs):
+		"""
+		This function computes the cache key of one call
+
+		Input data:
+			func - the called function
+			args - the positional arguments
+			kwargs - the keyword arguments
+
+		Output data:
+			The hex digest of the call
+		"""
+		def describe(value):
+			if isinstance(value, np.ndarray):
+				return 'array:' + arrayHash(value)
+			return repr(value)
+
+		if not func in self.codes:
+			self.codes[func] = codeHash(func)
+
+		h = hashlib.blake2b(digest_size = 20)
+		h.update((func.__module__ + '.' + func.__name__).encode())
+		h.update(('code:' + self.codes[func] + ' version:' + self.version).encode())
+		for value in args:
+			h.update(describe(value).encode())
+		for name in sorted(kwargs):
+			h.update((name + '=' + describe(kwargs[name])).encode())
+
+		return h.hexdigest()
+
+	def run(self, func, *args, **kwargs):
+		"""
+		This function returns the result of func(*args, **kwargs) from the cache, or computes and saves it
+
+		Input data:
+			func - the function. It must return an array or a tuple of arrays
+			args, kwargs - the arguments of func
+
+		Output data:
+			The result of func
+		"""
+		filename = os.path.join(self.path, self.key(func, args, kwargs) + '.npz')
+
+		if os.path.isfile(filename):
+			self.hits += 1
+			os.utime(filename)
+			with np.load(filename) as data:
+				result = [data['arr_%d' % i] for i in range(len(data.files) - 1)]
+				if data['tuple']:
+					return tuple(result)
+				return result[0]
+
+		self.misses += 1
+		result = func(*args, **kwargs)
+
+		if isinstance(result, tuple):
+			arrays = result
+		else:
+			arrays = (result,)
+
+		fd, tmp = tempfile.mkstemp(dir = self.path, prefix = 'tmp-', suffix = '.tmp.npz')
+		with os.fdopen(fd, 'wb') as f:
+			np.savez(f, *arrays, tuple = isinstance(result, tuple))
+		os.replace(tmp, filename)
+
+		self.evict()
+
+		return result
+
+	def evict(self):
+		"""
+		This function deletes the least recently used results until the cache fits in max_bytes
+		"""
+		files = [os.path.join(self.path, f) for f in os.listdir(self.path) if f.endswith('.npz') and not f.endswith('.tmp.npz')]
+		files = sorted(files, key = os.path.getmtime)
+		size = sum(os.path.getsize(f) for f in files)
+
+		for f in files:
+			if size <= self.max_bytes:
+				break
+			size -= os.path.getsize(f)
+			os.remove(f)
+
+	def stats(self):
+		"""
+		This function returns the cache statistics
+
+		Output data:
+			A dictionary with the hits, misses, number of entries and size in bytes of the cache
+		"""
+		files = [os.path.join(self.path, f) for f in os.listdir(self.path) if f.endswith('.npz') and not f.endswith('.tmp.npz')]
+
+		return {'hits': self.hits, 'misses': self.misses, 'entries': len(files), 'bytes': sum(os.path.getsize(f) for f in files)}
+
+	def clear(self):
+		"""
+		This function deletes all the cached results
+		"""
+		for f in os.listdir(self.path):
+			if f.endswith('.npz'):
+				os.remove(os.path.join(self.path, f))
@@ -1,6 +1,13 @@
 import numpy as np
 import numpy.matlib
 
+try:
+    from scipy import fft as sp_fft
+    from scipy import signal as sp_signal
+except ImportError:
+    sp_fft = None
+    sp_signal = None
+
 """
 This module contains:
 
@@ -10,7 +17,15 @@ bin2freq - tranform index of spectrum into frequency
 
 powerBands - ompute the power of the desired bands passed with bands
 
+SpectrumPlan - keeps the frequency bins of the spectrum features and computes the batched FFTs
+
 spectrumChn - computes the spectrum componentes for all channels
+
+psdChn - computes the Welch or multitaper power spectral density for all channels
+
+covShrinkage - computes the Ledoit-Wolf or OAS shrunk covariance matrices
+
+chConv - computes the covariance matrix between the channels of every observation
 """
 def freq2bin(f, fs, nfft):
     """
@@ -40,94 +55,329 @@ def bin2freq(n, nfft, fs):
     """
     return int(n*fs/nfft)
 
-def powerBands(X, bands, band_win=200, fs = 1000, nfft = 1024):
+class SpectrumPlan:
+    """
+    This class keeps the frequency bins of the spectrum features and computes the batched FFTs
+
+    Input Data:
+        workers - the number of threads used by scipy.fft for one transform. If scipy is not installed, numpy.fft is used
+            and workers is ignored. DEFAULT = None
+
+    The bins of a band are computed with freq2bin once for every (fs, nfft, band) and are reused by every call of
+    spectrumChn and powerBands that receives the same plan.
+    """
+    def __init__(self, workers = None):
+        self.workers = workers
+        self.cache = {}
+
+    def bins(self, fs, nfft, band):
+        """
+        This function returns the spectrum indexes of the frequencies from band
+
+        Input Data:
+            fs - sample frequency
+            nfft - number of points of the fft transform
+            band - the frequencies. Dimension: [1] or [2]
+
+        Output Data:
+            The spectrum index of every frequency from band
+        """
+        key = (fs, nfft, tuple(band))
+        if not(key in self.cache):
+            self.cache[key] = tuple(freq2bin(f, fs, nfft) for f in band)
+        return self.cache[key]
+
+    def fft(self, x, nfft, onesided = True):
+        """
+        This function computes the fft transform over the last axis of x
+
+        Input Data:
+            x - the data signal. The transform is computed over the last dimension
+            nfft - number of points of the fft transform
+            onesided - if True, only the nfft//2 + 1 positive frequencies are computed (rfft). DEFAULT = True
+
+        Output Data:
+            The fft transform of x
+        """
+        if sp_fft is None:
+            if onesided:
+                return np.fft.rfft(x, nfft, axis = -1)
+            return np.fft.fft(x, nfft, axis = -1)
+
+        if onesided:
+            return sp_fft.rfft(x, nfft, axis = -1, workers = self.workers)
+        return sp_fft.fft(x, nfft, axis = -1, workers = self.workers)
+
+spectrum_plan = SpectrumPlan()
+
+def powerBands(X, bands, band_win=200, fs = 1000, nfft = 1024, dtype = np.float32, chunk = 16, plan = None):
     """
     This function compute the power of the desired bands passed with bands
 
     Input Data:
-        X - the data signal. Dimension: [nr. channels x nr. samples]
+        X - the data signal. Dimension: [nr. observations x nr. channels x nr. samples]
         bands - the desired bands to be computed. Dimension: [nr. bands x 2], ex. if bands is [1x2] will be computed the power
             spectrum from bands[0] to bands[1]. The values are the desired FREQUENCIES.
         band_win - the dimension of window on which the bands will be computed. If the user desire to compute the band power 
             over entire signal, band_win will be 0. DEFAULT = 200.
         fs - the frequency sample of the signal. DEFAULT = 1000
         nfft - the desired number of fft transform points. DEFAULT = 1024.
+        dtype - the data type of xf. DEFAULT = np.float32
+        chunk - the number of observations transformed at once. X can be a memory-mapped array. DEFAULT = 16
+        plan - the SpectrumPlan used for the bins and the FFTs. If None, the module spectrum_plan is used. DEFAULT = None
 
     Output Data:
-        xf - the final features computed. Dimension: [nr. channels x nr. features]
+        xf - the final features computed. Dimension: [nr. observations x nr. channels x nr. bands * nr. windows]. The features
+            of one channel are ordered band by band and, inside a band, window by window.
+
+    One FFT is computed for every window of a chunk of observations and is shared by all the bands. When all the bands are
+    under fs/2, only the positive frequencies are computed (rfft).
     """
     dim = X.shape
 
     if band_win == 0:
-        band_win = dim[1]
+        band_win = dim[2]
+
+    nr_win = int(dim[2]/band_win)
+
+    if plan is None:
+        plan = spectrum_plan
 
-    xf = np.zeros((dim[0],dim[1],len(bands)*int(dim[2]/band_win)))
+    bins = [plan.bins(fs, nfft, band) for band in bands]
+    onesided = max(bh for bl,bh in bins) <= nfft//2 + 1
 
-    for rec,file in enumerate(X):
-        k = 0
-        for band in bands:
-            for win2 in range(0,dim[2],band_win):
-                bl = freq2bin(band[0],fs,nfft); bh = freq2bin(band[1],fs,nfft)
-                fft = np.fft.fft(file[:,win2:win2+band_win], nfft, axis = 1)
-                fft = abs(fft[:,bl:bh])*abs(fft[:,bl:bh])
-                xf[rec,:,k] = 20*np.log(np.sum(fft,axis=1))
-                k=k+1
+    xf = np.zeros((dim[0],dim[1],len(bands)*nr_win), dtype = dtype)
+
+    for start in range(0,dim[0],chunk):
+        xw = np.asarray(X[start:start+chunk])[:,:,:nr_win*band_win]
+        xw = xw.reshape(xw.shape[0],dim[1],nr_win,band_win)
+
+        fft = plan.fft(xw, nfft, onesided)
+        power = np.abs(fft)
+        power *= power
+
+        for k,(bl,bh) in enumerate(bins):
+            xf[start:start+chunk,:,k*nr_win:(k+1)*nr_win] = 20*np.log(np.sum(power[:,:,:,bl:bh],axis=3))
 
     return xf
 
-def spectrumChn(x, fs = 1000, freq = None, nfft = None):
+def spectrumChn(x, fs = 1000, freq = None, nfft = None, dtype = np.float32, chunk = 64, plan = None):
     """
     This function computes the spectrum componentes for all channels
 
     Input Data:
-        x - the data signal. Dimension: [nr. channels x nr. samples].
+        x - the data signal. Dimension: [nr. observations x nr. channels x nr. samples].
         fs - the sample frequency of the signal. DEFAULT = 1000
         freq - the desired frequencies to be savd as final features. If freq is None, all frequencies from spectrum
             will be saved. If len(freq)=1 will be saved all the frequencies lower that the freq. If len(freq) = 2, 
-            will be saved the freqencies from freq[0] to freq[1]. DEFAULT = None
+            will be saved the freqencies from freq[0] to freq[1]. freq is not modified. DEFAULT = None
         nfft - number of points for fft spectrum. DEFAULT = None
+        dtype - the data type of xf. DEFAULT = np.float32
+        chunk - the number of observations transformed at once. x can be a memory-mapped array. DEFAULT = 64
+        plan - the SpectrumPlan used for the bins and the FFTs. If None, the module spectrum_plan is used. DEFAULT = None
 
     Output Data:
-        xf - the final features computed. Dimension: [nr. channels x nr. features]
+        xf - the final features computed. Dimension: [nr. observations x nr. channels x nr. features]
     """
 
     if nfft is None:
         nfft = x.shape[2]
 
+    if plan is None:
+        plan = spectrum_plan
+
     if freq is None:
-        freq = np.empty((1),dtype = int)
-        freq[0] = int(nfft/2)
+        bl, bh = 0, int(nfft/2)
     else:
         if len(freq)==1:
-            freq[0] = int((nfft/fs)*freq[0])
+            bl, bh = 0, plan.bins(fs, nfft, freq)[0]
         else:
             if len(freq)==2:
-                freq[0] = int((nfft/fs)*freq[0])
-                freq[1] = int((nfft/fs)*freq[1])
+                bl, bh = plan.bins(fs, nfft, freq)
             else:
                 raise ValueError("Too many freq values")
 
-    if len(freq)==1:
-        xf = np.zeros((x.shape[0],x.shape[1],freq[0]))
+    onesided = bh <= nfft//2 + 1
+
+    xf = np.zeros((x.shape[0],x.shape[1],bh-bl), dtype = dtype)
+
+    for start in range(0,x.shape[0],chunk):
+        fft = plan.fft(np.asarray(x[start:start+chunk]), nfft, onesided)
+        fft = np.abs(fft[:,:,bl:bh])
+        fft *= fft
+        fft[fft==0]=0.00001
+
+        xf[start:start+chunk,:,:] = 20*np.log(fft)
+
+    return xf
+
+def psdChn(x, fs = 1000, method = 'welch', nperseg = 256, noverlap = None, nw = 4, freq = None, dtype = np.float32, chunk = 16, plan = None):
+    """
+    This function computes the Welch or multitaper power spectral density for all channels
+
+    Input Data:
+        x - the data signal. Dimension: [nr. observations x nr. channels x nr. samples] or the windows view returned by
+            preprocessing.spWin(..., view = True) with dimension [nr. observations x nr. windows x nr. channels x nr. samples]
+        fs - the sample frequency of the signal. DEFAULT = 1000
+        method - 'welch' or 'multitaper'. DEFAULT = 'welch'
+        nperseg - the number of samples of one Welch segment. DEFAULT = 256
+        noverlap - the number of samples of overlap between Welch segments. If None, noverlap = nperseg/2. DEFAULT = None
+        nw - the time-halfbandwidth product of the DPSS tapers. 2*nw - 1 tapers are used. DEFAULT = 4
+        freq - the desired frequencies to be saved as final features. If freq is None, all frequencies from spectrum
+            will be saved. If len(freq)=1 will be saved all the frequencies lower that the freq. If len(freq) = 2,
+            will be saved the freqencies from freq[0] to freq[1]. DEFAULT = None
+        dtype - the data type of xf. DEFAULT = np.float32
+        chunk - the number of observations transformed at once. x can be a memory-mapped array. DEFAULT = 16
+        plan - the SpectrumPlan used for the multitaper FFTs. If None, the module spectrum_plan is used. DEFAULT = None
+
+    Output Data:
+        xf - the final features computed, 20*log(psd) as for spectrumChn. Dimension: [nr. observations (* nr. windows) x
+            nr. channels x nr. features]
+
+    The Welch PSD is computed with scipy.signal.welch. The multitaper PSD is the mean of the one-sided periodograms of the
+    signal multiplied by every DPSS taper (scipy.signal.windows.dpss). Both are computed over the whole chunk at once.
+    """
+    if sp_signal is None:
+        raise ImportError("psdChn needs scipy")
+
+    if method != 'welch' and method != 'multitaper':
+        raise ValueError("It's not a valid psd method!")
+
+    if len(x.shape) == 4:
+        nr_win = x.shape[1]
+    else:
+        nr_win = 1
+
+    n_ch = x.shape[-2]
+    n_smp = x.shape[-1]
+
+    if plan is None:
+        plan = spectrum_plan
+
+    if method == 'welch':
+        nperseg = min(nperseg, n_smp)
+        f = np.fft.rfftfreq(nperseg, 1/fs)
     else:
-        xf = np.zeros((x.shape[0],x.shape[1],freq[1]-freq[0]))
+        tapers = sp_signal.windows.dpss(n_smp, nw, Kmax = int(2*nw - 1)).astype(dtype)
+        f = np.fft.rfftfreq(n_smp, 1/fs)
 
-    for rec,i in zip(x,range(len(x))):
-        fft = np.fft.fft(rec, n=nfft)
+    if freq is None:
+        sel = np.ones(len(f), dtype = bool)
+    else:
         if len(freq)==1:
-            fft = np.abs(fft[:,:freq[0]])
+            sel = f < freq[0]
         else:
-            fft = np.abs(fft[:,freq[0]:freq[1]])
-        fft = fft*fft
-        fft[fft==0]=0.00001
+            if len(freq)==2:
+                sel = (f >= freq[0]) & (f < freq[1])
+            else:
+                raise ValueError("Too many freq values")
 
-        xf[i,:,:] = 20*np.log(fft)
+    xf = np.zeros((x.shape[0]*nr_win,n_ch,np.sum(sel)), dtype = dtype)
+
+    step = max(1, chunk//nr_win)
+    for start in range(0,x.shape[0],step):
+        xc = np.asarray(x[start:start+step], dtype = dtype).reshape(-1,n_ch,n_smp)
+
+        if method == 'welch':
+            psd = sp_signal.welch(xc, fs = fs, nperseg = nperseg, noverlap = noverlap, axis = -1)[1]
+        else:
+            fft = plan.fft(xc[:,:,None,:]*tapers, n_smp)
+            psd = np.abs(fft)
+            psd *= psd
+            psd = psd.mean(axis=2)/fs
+            psd[:,:,1:(n_smp + 1)//2] *= 2
+
+        psd = psd[:,:,sel]
+        psd[psd==0]=0.00001
+
+        xf[start*nr_win:start*nr_win+len(psd),:,:] = 20*np.log(psd)
 
     return xf
 
-def chConv(x):
-    xc = np.zeros((x.shape[0],x.shape[1],x.shape[1]))
-    for i in range(len(x)):
-        xc[i,:,:] = np.cov(x[i,:,:])
+def covShrinkage(xm, cov, method = 'lw'):
+    """
+    This function computes the shrunk covariance matrices (1 - s)*cov + s*mu*I, with mu = trace(cov)/nr. channels
+
+    Input Data:
+        xm - the centered data signal. Dimension: [nr. observations x nr. channels x nr. samples]
+        cov - the covariance matrices of xm. Dimension: [nr. observations x nr. channels x nr. channels]
+        method - 'lw' for the Ledoit-Wolf shrinkage or 'oas' for the Oracle Approximating Shrinkage. DEFAULT = 'lw'
+
+    Output Data:
+        The shrunk covariance matrices. Dimension: [nr. observations x nr. channels x nr. channels]
+
+    The shrinkage s of every observation is computed as in sklearn.covariance.ledoit_wolf_shrinkage and
+    sklearn.covariance.oas, from the empirical (biased) covariance of the observation.
+    """
+    n_ch = xm.shape[1]
+    n_smp = xm.shape[2]
+
+    emp_cov = cov*((n_smp - 1)/n_smp)
+    emp_trace = np.trace(emp_cov, axis1=1, axis2=2)
+    mu = emp_trace/n_ch
+
+    if method == 'lw':
+        x2 = xm*xm
+        beta_ = np.sum(np.sum(x2, axis=1)**2, axis=1)
+        delta_ = np.sum(emp_cov*emp_cov, axis=(1,2))
+        beta = (beta_/n_smp - delta_)/(n_ch*n_smp)
+        delta = (delta_ - 2*mu*emp_trace + n_ch*mu*mu)/n_ch
+        beta = np.minimum(beta, delta)
+        shrink = np.divide(beta, delta, out=np.zeros_like(beta), where=beta!=0)
+    elif method == 'oas':
+        alpha = np.mean(emp_cov*emp_cov, axis=(1,2))
+        num = alpha + mu*mu
+        den = (n_smp + 1)*(alpha - mu*mu/n_ch)
+        shrink = np.minimum(np.divide(num, den, out=np.ones_like(num), where=den!=0), 1)
+    else:
+        raise ValueError("It's not a valid shrinkage method!")
+
+    shrink = shrink.astype(cov.dtype)
+    cov_shrunk = cov*(1 - shrink)[:,None,None]
+    idx = np.arange(n_ch)
+    cov_shrunk[:,idx,idx] += (shrink*np.trace(cov, axis1=1, axis2=2)/n_ch)[:,None]
+
+    return cov_shrunk
+
+def chConv(x, dtype = np.float32, shrinkage = None, chunk = 1024):
+    """
+    This function computes the covariance matrix between the channels of every observation
+
+    Input Data:
+        x - the data signal. Dimension: [nr. observations x nr. channels x nr. samples] or the windows view returned by
+            preprocessing.spWin(..., view = True) with dimension [nr. observations x nr. windows x nr. channels x nr. samples]
+        dtype - the data type of the computation and of xc. DEFAULT = np.float32
+        shrinkage - None, 'lw' (Ledoit-Wolf) or 'oas' (Oracle Approximating Shrinkage). If not None, the covariance matrices
+            are shrunk with covShrinkage. DEFAULT = None
+        chunk - the number of covariance matrices computed at once. DEFAULT = 1024
+
+    Output Data:
+        xc - the covariance matrices. Dimension: [nr. observations (* nr. windows) x nr. channels x nr. channels]
+
+    The covariance matrices are the same as np.cov(x[i,:,:]). They are computed in chunks, with one batched matrix product
+    of the centered signals per chunk, so x can be a memory-mapped array.
+    """
+    if len(x.shape) == 4:
+        nr_win = x.shape[1]
+    else:
+        nr_win = 1
+
+    n_ch = x.shape[-2]
+    n_smp = x.shape[-1]
+
+    xc = np.empty((x.shape[0]*nr_win,n_ch,n_ch), dtype = dtype)
+
+    step = max(1, chunk//nr_win)
+    for start in range(0,x.shape[0],step):
+        xm = np.asarray(x[start:start+step], dtype = dtype).reshape(-1,n_ch,n_smp)
+        xm = xm - xm.mean(axis=2, keepdims=True)
+
+        cov = np.matmul(xm, xm.transpose(0,2,1))
+        cov /= n_smp - 1
+
+        if not(shrinkage is None):
+            cov = covShrinkage(xm, cov, shrinkage)
+
+        xc[start*nr_win:start*nr_win+len(cov),:,:] = cov
 
-    return xc
\ No newline at end of file
+    return xc
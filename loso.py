@@ -0,0 +1,139 @@
+import os
+import csv
+import json
+import argparse
+import numpy as np
+from FileUtils import load_data
+from FileUtils import load_subjects
+from FileUtils import loso_indexes
+import preprocessing
+from pipeline import run_pipeline
+from pipeline import extract_features
+from pipeline import train_cgan
+from pipeline import worker_pool
+
+"""
+This loso module runs the leave-one-subject-out evaluation of all the subjects from the pipeline config file, with one
+worker process per fold:
+
+	python loso.py pipeline_config.json [--n_jobs N] [--threads N]
+
+The pipeline is run until the input_file stage, then every fold computes its windows, features and scaler from the
+records of the training subjects, trains the CGAN and is evaluated on the held-out subject. The models of every fold are
+saved in <work_dir>/loso/<subject>/ and the results of all the folds in <work_dir>/loso/loso_results.csv.
+
+This module contains:
+
+fold_features - computes the windows and features of the records idx, chunk by chunk
+
+run_fold - trains and evaluates one leave-one-subject-out fold
+
+run_loso - runs all the leave-one-subject-out folds in parallel worker processes
+
+"""
+
+def fold_features(x, y, idx, cfg, chunk = 64):
+	"""
+	This function computes the windows and features (pipeline.extract_features) of the records idx, chunk by chunk
+
+	Input data:
+		x - the records, ex. the memory-mapped KaraOne_EEGSpeech_X.npy. Dimension: [nr. records x nr. channels x nr. samples]
+		y - the records targets
+		idx - the indexes of the used records
+		cfg - the pipeline config. The windowing and features sections are used
+		chunk - the number of records read at once. DEFAULT = 64
+
+	Output data:
+		xf - the features of every window
+		yf - the target of every window
+	"""
+	p = cfg['windowing']
+
+	xf = []
+	yf = []
+	for start in range(0,len(idx),chunk):
+		ic = idx[start:start+chunk]
+		xw, yw = preprocessing.spWin(np.asarray(x[ic]), p['window'], y[ic], hop = p.get('hop'), view = True)
+
+		xf.append(extract_features(xw, cfg))
+		yf.append(yw)
+
+	return np.concatenate(xf), np.concatenate(yf)
+
+def run_fold(cfg, input_dir, subject, idxtrain, idxtest, out_dir):
+	"""
+	This function trains and evaluates one leave-one-subject-out fold (pipeline.train_cgan)
+
+	Input data:
+		cfg - the pipeline config. The windowing, features and train sections are used
+		input_dir - the folder of KaraOne_EEGSpeech_X.npy and KaraOne_EEGSpeech_y.npy
+		subject - the name of the held-out subject
+		idxtrain - the indexes of the train records
+		idxtest - the indexes of the test records
+		out_dir - the folder where the models, the scaler and the history are saved
+
+	Output data:
+		A dictionary with the subject, the number of train and test windows and the last epoch losses and accuracies
+	"""
+	dtype = np.dtype(cfg.get('dtype', 'float32'))
+
+	x, y = load_data('KaraOne_EEGSpeech_X.npy', 'KaraOne_EEGSpeech_y.npy', path = input_dir, mmap_mode = 'r')
+
+	xtrain, ytrain = fold_features(x, y, idxtrain, cfg)
+	xtest, ytest = fold_features(x, y, idxtest, cfg)
+
+	scaler = preprocessing.FeatureStdScaler(dtype = dtype).fit(xtrain)
+	xtrain = scaler.transform(xtrain, out = xtrain)
+	xtest = scaler.transform(xtest, out = xtest)
+
+	history, thistory, history_batch = train_cgan(cfg, xtrain, ytrain, xtest, ytest, out_dir)
+	scaler.save(os.path.join(out_dir, 'scaler.npz'))
+
+	return {'subject': subject, 'n_train': len(xtrain), 'n_test': len(xtest), 'train_loss': history[0][-1],
+		'train_acc': history[1][-1], 'test_loss': thistory[0][-1], 'test_acc': thistory[1][-1]}
+
+def run_loso(cfg, n_jobs = 1, threads = 1):
+	"""
+	This function runs all the leave-one-subject-out folds in parallel worker processes
+
+	Input data:
+		cfg - the pipeline config (see pipeline_config.json)
+		n_jobs - the number of worker processes. DEFAULT = 1
+		threads - the number of TensorFlow and BLAS threads of every worker (see pipeline.worker_pool). DEFAULT = 1
+
+	Output data:
+		The list with the results of every fold (see run_fold). The results are also saved in loso_results.csv
+	"""
+	dirs = run_pipeline(cfg, until = 'input_file')
+	input_dir = dirs['input_file']
+
+	out_dir = os.path.join(cfg.get('work_dir', 'pipeline_out'), 'loso')
+	if not os.path.isdir(out_dir):
+		os.makedirs(out_dir)
+
+	names, subject = load_subjects(input_dir)
+
+	with worker_pool(n_jobs, threads) as executor:
+		futures = [executor.submit(run_fold, cfg, input_dir, name, idxtrain, idxtest, os.path.join(out_dir, name))
+			for name, idxtrain, idxtest in loso_indexes(subject, names)]
+		results = [future.result() for future in futures]
+
+	with open(os.path.join(out_dir, 'loso_results.csv'), 'w', newline = '') as f:
+		writer = csv.DictWriter(f, fieldnames = list(results[0].keys()))
+		writer.writeheader()
+		writer.writerows(results)
+
+	return results
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = 'Run the leave-one-subject-out evaluation of all the subjects.')
+	parser.add_argument('config', help = 'the JSON config file')
+	parser.add_argument('--n_jobs', type = int, default = 1, help = 'the number of worker processes')
+	parser.add_argument('--threads', type = int, default = 1, help = 'the number of threads of every worker')
+	args = parser.parse_args()
+
+	with open(args.config) as f:
+		cfg = json.load(f)
+
+	for result in run_loso(cfg, args.n_jobs, args.threads):
+		print(result)
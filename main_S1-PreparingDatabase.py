@@ -5,10 +5,14 @@ from FileUtils import create_input_file
 
 base_path = r'E:\DataBase\DB Imagined Speech KO'
 sel_subjects = ['MM05', 'MM10', 'MM11', 'MM16', 'MM18', 'MM19', 'MM21', 'P02']
-data_evidence = pd.read_excel(r'KO evidence v2.xlsx')
 save_path = r'C:\Doctorat\GANImagSpeech\DataBase'
 drop_ch = (['M1', 'M2', 'EKG', 'EMG', 'Trigger'])
+n_jobs = 4
+# 'fif' for one .raw.fif file per trial, 'npz' for one store per subject
+fmt = 'fif'
 
-# data_segmentation(base_path, sel_subjects, data_evidence)
-create_input_file(save_path, drop_ch)
+if __name__ == '__main__':
+	data_evidence = pd.read_excel(r'KO evidence v2.xlsx')
 
+	# data_segmentation(base_path, sel_subjects, data_evidence, save_path = save_path, n_jobs = n_jobs, output = fmt)
+	create_input_file(save_path, drop_ch, fmt = fmt, n_jobs = n_jobs)
@@ -1,35 +1,54 @@
 import numpy as np
 from FileUtils import load_data
-from FileUtils import split_leaveOneOut
+from FileUtils import load_subjects
+from FileUtils import loso_indexes
 import preprocessing
 import featureExtr
+from featureCache import FeatureCache
 
-x, y = load_data("KaraOne_EEGSpeech_X.npy","KaraOne_EEGSpeech_y.npy")
+x, y = load_data("KaraOne_EEGSpeech_X.npy","KaraOne_EEGSpeech_y.npy", mmap_mode = "r")
 
-# sel_subjects = ['MM05', 'MM10', 'MM11', 'MM16', 'MM18', 'MM19', 'MM21', 'P02']
-# subj_idx_start = np.array([0, 120, 236, 362, 493, 603, 734, 864])
-# subj_idx_stop = np.array([119, 235, 361, 492, 602, 733, 863, 993])
+test_subject = 'MM16'
 
-idxtrain = np.array([0, 361, (361 + 131), 993])
-idxtest = np.array([361, (361 + 131)])
+names, subject = load_subjects()
+folds = dict((name, (idxtrain, idxtest)) for name, idxtrain, idxtest in loso_indexes(subject, names))
+idxtrain, idxtest = folds[test_subject]
 
-xtrain, ytrain, xtest, ytest = split_leaveOneOut(x, y, idxtrain, idxtest)
+xtrain, ytrain, xtest, ytest = x[idxtrain], y[idxtrain], x[idxtest], y[idxtest]
 
 window = 1000
+dtype = np.float32
+# None, 'lw' (Ledoit-Wolf) or 'oas'
+shrinkage = None
+# 'cov' for the channels covariance, 'welch' or 'multitaper' for the power spectral density
+features = 'cov'
 
-xtrain, ytrain = preprocessing.spWin(xtrain, window, ytrain)
-xtest, ytest = preprocessing.spWin(xtest, window, ytest)
+# spWin(view = True) copies nothing, so only the functions below it are cached
+cache = FeatureCache('feature_cache')
+
+xtrain, ytrain = preprocessing.spWin(xtrain, window, ytrain, view = True)
+xtest, ytest = preprocessing.spWin(xtest, window, ytest, view = True)
 
 print(xtrain.shape)
 print(xtest.shape)
 
-xtrain = featureExtr.chConv(xtrain)
-xtest = featureExtr.chConv(xtest)
+if features == 'cov':
+	xtrain = cache.run(featureExtr.chConv, xtrain, dtype = dtype, shrinkage = shrinkage)
+	xtest = cache.run(featureExtr.chConv, xtest, dtype = dtype, shrinkage = shrinkage)
+else:
+	xtrain = cache.run(featureExtr.psdChn, xtrain, method = features, freq = [1, 100], dtype = dtype)
+	xtest = cache.run(featureExtr.psdChn, xtest, method = features, freq = [1, 100], dtype = dtype)
+
+scaler = preprocessing.FeatureStdScaler(dtype = dtype).fit(xtrain)
+mean, std = scaler.params()
+
+xtrain = cache.run(preprocessing.featureStd, xtrain, mean = mean, std = std, dtype = dtype)
+xtest = cache.run(preprocessing.featureStd, xtest, mean = mean, std = std, dtype = dtype)
 
-xtrain, mean, std = preprocessing.featureStd(xtrain, flag = 1)
-xtest = preprocessing.featureStd(xtest, mean = mean, std = std)
+print(cache.stats())
 
 np.save('xtrain', xtrain)
 np.save('ytrain', ytrain)
 np.save('xtest', xtest)
-np.save('ytest', ytest)
\ No newline at end of file
+np.save('ytest', ytest)
+scaler.save('scaler.npz')
\ No newline at end of file
@@ -1,3 +1,5 @@
+import numpy as np
+import shutil
 from FileUtils import load_data
 import CGAN
 
@@ -10,18 +12,25 @@ tdataset = [xtest, ytest]
 dim = xtrain.shape
 tdim = xtest.shape
 
+# the scaler of the features (main_S2-FeatureExtraction.py), bundled with the models before the training, so a missing
+# scaler fails now and not after the training
+shutil.copy('scaler.npz', 'scaler_leaveOneOut_MM16.npz')
+
 # size of the latent space
 latent_dim = 1000
 # create the discriminator
 d_model = CGAN.define_discriminator(in_shape=(dim[1],dim[2],1))
-# create the generator
-g_model = CGAN.define_generator(latent_dim)
+# create the generator, with the size of the features (62x62 covariance or 62xF psd)
+g_model = CGAN.define_generator(latent_dim, out_size=(dim[1],dim[2]))
 # create the gan
 gan_model = CGAN.define_gan(g_model, d_model)
 gan_model.summary()
 
-# train model
-history, thistory,history_batch = CGAN.train(g_model, d_model, gan_model, dataset, latent_dim, tdataset, n_epochs = 50)
+# train model, saving a checkpoint every epoch; if the run is interrupted, running the script again resumes it from the
+# last checkpoint (delete the checkpoint folder to start a new run)
+checkpoint_dir = 'checkpoints_leaveOneOut_MM16'
+history, thistory,history_batch = CGAN.train(g_model, d_model, gan_model, dataset, latent_dim, tdataset, n_epochs = 50,
+	checkpoint_dir = checkpoint_dir, checkpoint_every = 1, max_to_keep = 3)
 
 gan_model.save('cgan_generator_leaveOneOut_MM16.h5')
 g_model.save('generator_model_leaveOneOut_MM16.h5')
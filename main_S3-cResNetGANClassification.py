@@ -1,3 +1,5 @@
+import numpy as np
+import shutil
 from FileUtils import load_data
 import CGAN
 
@@ -10,6 +12,10 @@ tdataset = [xtest, ytest]
 dim = xtrain.shape
 tdim = xtest.shape
 
+# the scaler of the features (main_S2-FeatureExtraction.py), bundled with the models before the training, so a missing
+# scaler fails now and not after the training
+shutil.copy('scaler.npz', 'scaler_leaveOneOut_MM16.npz')
+
 ytrain = ytrain + 1;
 xtrain = xtrain + 1;
 
@@ -17,8 +23,8 @@ xtrain = xtrain + 1;
 latent_dim = 1000
 # create the discriminator
 d_model = CGAN.define_discriminator(in_shape=(dim[1],dim[2],1))
-# create the generator
-g_model = CGAN.define_generator(latent_dim)
+# create the generator, with the size of the features (62x62 covariance or 62xF psd)
+g_model = CGAN.define_generator(latent_dim, out_size=(dim[1],dim[2]))
 # create the gan
 gan_model = CGAN.define_gan(g_model, d_model)
 gan_model.summary()
@@ -0,0 +1,357 @@
+import os
+import json
+import shutil
+import hashlib
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from segmentation import data_segmentation
+from FileUtils import create_input_file
+from FileUtils import load_data
+from FileUtils import load_subjects
+from FileUtils import loso_indexes
+import preprocessing
+import featureExtr
+
+"""
+This pipeline module runs the stages segmentation -> input_file -> windowing -> features -> standardize -> train from
+one JSON config file:
+
+	python pipeline.py pipeline_config.json [--until STAGE] [--force STAGE [STAGE ...]]
+
+Every stage writes its outputs in <work_dir>/<stage>/ and a <work_dir>/<stage>.stamp file with the fingerprint of its
+config section and of the stages it depends on. A stage is skipped when its stamp matches, so after a crash or a config
+change only the changed stage and the stages after it run again. The outputs are first written in <work_dir>/<stage>.tmp/
+and renamed when the stage finishes, so an interrupted stage never leaves partial outputs.
+
+A stage config section with an "input" folder is not run: the folder is used as the stage output (ex. an already
+segmented DataBase).
+
+This module contains:
+
+fileStamp - computes the fingerprint of the files of a folder from their names, sizes and modification times
+
+extract_features - computes the covariance or psd features of the windows, as set in the features section
+
+train_cgan - builds, trains and saves the CGAN, as set in the train section
+
+worker_pool - creates a pool of spawned worker processes with a limited number of threads each
+
+run_segmentation, run_input_file, run_windowing, run_features, run_standardize, run_train - the pipeline stages
+
+run_pipeline - runs the pipeline stages in order, skipping the ones whose inputs are unchanged
+
+"""
+
+def fileStamp(path, ext = None):
+	"""
+	This function computes the fingerprint of the files of a folder from their names, sizes and modification times
+
+	Input data:
+		path - the folder or the file
+		ext - if not None, only the files ending with ext are used. DEFAULT = None
+
+	Output data:
+		The hex digest of the files
+	"""
+	h = hashlib.blake2b(digest_size = 20)
+
+	if os.path.isfile(path):
+		files = [path]
+	else:
+		files = []
+		for root, dirs, names in os.walk(path):
+			files.extend(os.path.join(root, name) for name in names if ext is None or name.endswith(ext))
+
+	for f in sorted(files):
+		st = os.stat(f)
+		h.update(('%s %d %d' % (f, st.st_size, st.st_mtime_ns)).encode())
+
+	return h.hexdigest()
+
+def extract_features(x, cfg):
+	"""
+	This function computes the covariance (featureExtr.chConv) or psd (featureExtr.psdChn) features of the windows, as
+	set in the features section
+
+	Input data:
+		x - the windows. Dimension: [nr. windows x nr. channels x window] or the 4D view of preprocessing.spWin(..., view = True)
+		cfg - the pipeline config. The features section and dtype are used
+
+	Output data:
+		The features of every window
+	"""
+	p = cfg['features']
+	dtype = np.dtype(cfg.get('dtype', 'float32'))
+
+	if p.get('method', 'cov') == 'cov':
+		return featureExtr.chConv(x, dtype = dtype, shrinkage = p.get('shrinkage'))
+
+	return featureExtr.psdChn(x, method = p['method'], nperseg = p.get('nperseg', 256), nw = p.get('nw', 4),
+		freq = p.get('freq'), dtype = dtype)
+
+def train_cgan(cfg, xtrain, ytrain, xtest, ytest, out_dir):
+	"""
+	This function builds, trains and saves the CGAN, as set in the train section
+
+	Input data:
+		cfg - the pipeline config. The train section is used
+		xtrain, ytrain - the standardized train features and targets
+		xtest, ytest - the standardized test features and targets
+		out_dir - the folder where the models, the history and the training logs are saved
+
+	Output data:
+		history, thistory, history_batch - the train history, the test history and the history of every step (see CGAN.train)
+	"""
+	import CGAN
+
+	p = cfg['train']
+
+	dim = xtrain.shape
+	latent_dim = p.get('latent_dim', 1000)
+	loss = p.get('loss', 'mse')
+	seed = p.get('seed')
+
+	d_model = CGAN.define_discriminator(in_shape=(dim[1],dim[2],1), loss = loss, seed = seed)
+	g_model = CGAN.define_generator(latent_dim, out_size = (dim[1],dim[2]), **p.get('generator', {}))
+	gan_model = CGAN.define_gan(g_model, d_model, loss = loss)
+
+	if not os.path.isdir(out_dir):
+		os.makedirs(out_dir)
+
+	history, thistory, history_batch = CGAN.train(g_model, d_model, gan_model, [xtrain, ytrain], latent_dim, [xtest, ytest],
+		n_epochs = p.get('n_epochs', 50), n_batch = p.get('n_batch', 128),
+		eval_every = p.get('eval_every', 1), eval_samples = p.get('eval_samples'), log_file = os.path.join(out_dir, 'train_log.jsonl'),
+		metrics_file = os.path.join(out_dir, 'train_steps.jsonl'), seed = seed)
+
+	gan_model.save(os.path.join(out_dir, 'cgan_generator.h5'))
+	g_model.save(os.path.join(out_dir, 'generator_model.h5'))
+	d_model.save(os.path.join(out_dir, 'discriminator_model.h5'))
+	np.save(os.path.join(out_dir, 'history.npy'), history)
+	np.save(os.path.join(out_dir, 'thistory.npy'), thistory)
+	np.save(os.path.join(out_dir, 'history_batch.npy'), history_batch)
+
+	return history, thistory, history_batch
+
+def init_worker_threads(threads, initializer = None, initargs = ()):
+	"""
+	This function limits the number of TensorFlow threads of a worker process, then runs the initializer of the pool
+	"""
+	import tensorflow as tf
+	tf.config.threading.set_intra_op_parallelism_threads(threads)
+	tf.config.threading.set_inter_op_parallelism_threads(threads)
+
+	if not(initializer is None):
+		initializer(*initargs)
+
+def worker_pool(n_jobs, threads = 1, initializer = None, initargs = ()):
+	"""
+	This function creates a pool of spawned worker processes with a limited number of threads each
+
+	Input data:
+		n_jobs - the number of worker processes
+		threads - the number of TensorFlow and BLAS threads of every worker. DEFAULT = 1
+		initializer - the function run once in every worker, after the threads are limited. DEFAULT = None
+		initargs - the arguments of initializer. DEFAULT = ()
+
+	Output data:
+		The ProcessPoolExecutor. The workers are spawned, not forked, because TensorFlow is not fork safe, and n_jobs
+		workers with threads threads each do not oversubscribe the CPU.
+	"""
+	# the BLAS libraries read the thread limits when they are loaded, so they are set before the workers start
+	for name in ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS']:
+		os.environ[name] = str(threads)
+
+	return ProcessPoolExecutor(max_workers = n_jobs, mp_context = multiprocessing.get_context('spawn'),
+		initializer = init_worker_threads, initargs = (threads, initializer, initargs))
+
+def run_segmentation(cfg, dirs, out_dir):
+	"""
+	This stage splits the .cnt recordings into trials (segmentation.data_segmentation)
+	"""
+	p = cfg['segmentation']
+	data_evidence = pd.read_excel(p['evidence'])
+	data_segmentation(p['base_path'], p['subjects'], data_evidence, save_path = out_dir, n_jobs = p.get('n_jobs', 1),
+		output = p.get('output', 'npz'))
+
+def run_input_file(cfg, dirs, out_dir):
+	"""
+	This stage creates KaraOne_EEGSpeech_X.npy and KaraOne_EEGSpeech_y.npy (FileUtils.create_input_file)
+	"""
+	p = cfg['input_file']
+	create_input_file(dirs['segmentation'], p['drop_ch'], fmt = cfg['segmentation'].get('output', 'npz'), save_path = out_dir,
+		n_jobs = p.get('n_jobs', 1), dtype = np.dtype(cfg.get('dtype', 'float32')))
+
+def run_windowing(cfg, dirs, out_dir):
+	"""
+	This stage splits the records into train and test and into windows (preprocessing.spWin). The records of the
+	test_subject are the test set, the records of all the other subjects the train set (FileUtils.loso_indexes).
+	"""
+	p = cfg['windowing']
+	dtype = np.dtype(cfg.get('dtype', 'float32'))
+
+	x, y = load_data('KaraOne_EEGSpeech_X.npy', 'KaraOne_EEGSpeech_y.npy', path = dirs['input_file'], mmap_mode = 'r')
+	names, subject = load_subjects(dirs['input_file'])
+	if not p['test_subject'] in names:
+		raise ValueError("Unknown test subject: %s (subjects: %s)" % (p['test_subject'], ', '.join(names)))
+
+	folds = dict((name, (idxtrain, idxtest)) for name, idxtrain, idxtest in loso_indexes(subject, names))
+	idxtrain, idxtest = folds[p['test_subject']]
+	xtrain, ytrain, xtest, ytest = x[idxtrain], y[idxtrain], x[idxtest], y[idxtest]
+
+	xtrain, ytrain = preprocessing.spWin(xtrain, p['window'], ytrain, dtype = dtype, hop = p.get('hop'))
+	xtest, ytest = preprocessing.spWin(xtest, p['window'], ytest, dtype = dtype, hop = p.get('hop'))
+
+	np.save(os.path.join(out_dir, 'xtrain'), xtrain)
+	np.save(os.path.join(out_dir, 'ytrain'), ytrain)
+	np.save(os.path.join(out_dir, 'xtest'), xtest)
+	np.save(os.path.join(out_dir, 'ytest'), ytest)
+
+def run_features(cfg, dirs, out_dir):
+	"""
+	This stage computes the covariance or psd features of the windows (extract_features)
+	"""
+	for name in ['train', 'test']:
+		x, y = load_data('x' + name + '.npy', 'y' + name + '.npy', path = dirs['windowing'], mmap_mode = 'r')
+		x = extract_features(x, cfg)
+		np.save(os.path.join(out_dir, 'x' + name), x)
+		np.save(os.path.join(out_dir, 'y' + name), y)
+
+def run_standardize(cfg, dirs, out_dir):
+	"""
+	This stage standardizes the features with the train mean and std (preprocessing.featureStd). The statistics are
+	fitted and applied chunk by chunk, so the features are never fully loaded in memory.
+	"""
+	dtype = np.dtype(cfg.get('dtype', 'float32'))
+
+	xtrain, ytrain = load_data('xtrain.npy', 'ytrain.npy', path = dirs['features'], mmap_mode = 'r')
+	xtest, ytest = load_data('xtest.npy', 'ytest.npy', path = dirs['features'], mmap_mode = 'r')
+
+	scaler = preprocessing.FeatureStdScaler(dtype = dtype).fit(xtrain)
+
+	for name, x, y in [('train', xtrain, ytrain), ('test', xtest, ytest)]:
+		out = np.lib.format.open_memmap(os.path.join(out_dir, 'x' + name + '.npy'), mode = 'w+', dtype = dtype, shape = x.shape)
+		preprocessing.streamTransform(x, scaler.transform, out = out)
+		out.flush()
+		del out
+		np.save(os.path.join(out_dir, 'y' + name), y)
+
+	scaler.save(os.path.join(out_dir, 'scaler.npz'))
+
+def run_train(cfg, dirs, out_dir):
+	"""
+	This stage trains the CGAN and saves the models, the history and the scaler used for the features (train_cgan)
+	"""
+	xtrain, ytrain = load_data('xtrain.npy', 'ytrain.npy', path = dirs['standardize'])
+	xtest, ytest = load_data('xtest.npy', 'ytest.npy', path = dirs['standardize'])
+
+	# bundled before the training, so a missing scaler fails before the training and not after it
+	shutil.copy(os.path.join(dirs['standardize'], 'scaler.npz'), os.path.join(out_dir, 'scaler.npz'))
+
+	train_cgan(cfg, xtrain, ytrain, xtest, ytest, out_dir)
+
+# (name, function, stages it depends on)
+STAGES = [
+	('segmentation', run_segmentation, []),
+	('input_file', run_input_file, ['segmentation']),
+	('windowing', run_windowing, ['input_file']),
+	('features', run_features, ['windowing']),
+	('standardize', run_standardize, ['features']),
+	('train', run_train, ['standardize']),
+]
+
+def run_pipeline(cfg, until = None, force = ()):
+	"""
+	This function runs the pipeline stages in order, skipping the ones whose inputs are unchanged
+
+	Input data:
+		cfg - the pipeline config (see pipeline_config.json)
+		until - the name of the last stage to run. If None, all the stages are run. DEFAULT = None
+		force - the names of the stages that are run even if their inputs are unchanged. DEFAULT = ()
+
+	Output data:
+		A dictionary with the output folder of every stage that was run or skipped
+	"""
+	names = [name for name, func, deps in STAGES]
+	for name in list(force) + [until]:
+		if not(name is None) and not(name in names):
+			raise ValueError("Unknown stage: %s" % name)
+
+	work_dir = cfg.get('work_dir', 'pipeline_out')
+	if not os.path.isdir(work_dir):
+		os.makedirs(work_dir)
+
+	dirs = {}
+	fingerprints = {}
+	rerun = set()
+
+	for name, func, deps in STAGES:
+		params = cfg.get(name, {})
+
+		h = hashlib.blake2b(digest_size = 20)
+		h.update(json.dumps(params, sort_keys = True).encode())
+		h.update(str(cfg.get('dtype', 'float32')).encode())
+		for dep in deps:
+			h.update(fingerprints[dep].encode())
+
+		if 'input' in params:
+			dirs[name] = params['input']
+			h.update(fileStamp(params['input']).encode())
+			fingerprints[name] = h.hexdigest()
+			print('[%s] using %s' % (name, params['input']))
+		else:
+			if name == 'segmentation':
+				h.update(fileStamp(params['base_path'], '.cnt').encode())
+				h.update(fileStamp(params['evidence']).encode())
+			fingerprints[name] = h.hexdigest()
+
+			out_dir = os.path.join(work_dir, name)
+			stamp = os.path.join(work_dir, name + '.stamp')
+			dirs[name] = out_dir
+
+			done = os.path.isdir(out_dir) and os.path.isfile(stamp)
+			if done:
+				with open(stamp) as f:
+					done = f.read() == fingerprints[name]
+
+			if done and not(name in force) and not(rerun.intersection(deps)):
+				print('[%s] up to date, skipped' % name)
+			else:
+				print('[%s] running' % name)
+				tmp_dir = out_dir + '.tmp'
+				if os.path.isdir(tmp_dir):
+					shutil.rmtree(tmp_dir)
+				os.makedirs(tmp_dir)
+
+				func(cfg, dirs, tmp_dir)
+
+				if os.path.isfile(stamp):
+					os.remove(stamp)
+				if os.path.isdir(out_dir):
+					shutil.rmtree(out_dir)
+				os.replace(tmp_dir, out_dir)
+
+				with open(stamp + '.tmp', 'w') as f:
+					f.write(fingerprints[name])
+				os.replace(stamp + '.tmp', stamp)
+
+				rerun.add(name)
+
+		if name == until:
+			break
+
+	return dirs
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = 'Run the imagined speech pipeline from a JSON config file.')
+	parser.add_argument('config', help = 'the JSON config file')
+	parser.add_argument('--until', default = None, help = 'the last stage to run')
+	parser.add_argument('--force', nargs = '*', default = [], help = 'the stages to run even if their inputs are unchanged')
+	args = parser.parse_args()
+
+	with open(args.config) as f:
+		cfg = json.load(f)
+
+	run_pipeline(cfg, until = args.until, force = args.force)
@@ -1,5 +1,4 @@
 import numpy as np
-import numpy.matlib
 
 """ 
 This preprocessing module contains:
@@ -12,64 +11,77 @@ featureNorm - transform the EEG signal space into range [0, 1] over the features
 
 featureStd - transform the EEG signal space into a space uit mean 0 and std 1 over the features
 
+featureNormRange - transform the EEG signal space into range rng over the features
+
 mat3d2mat2d - reshape the 3D matrix x into a 2D matrix
 
 spWin - This function split a matrix x of dimension [nr. observations x nr. channels x nr. samples] into a matrix with dimension 
 	[nr. observations * (nr. samples/window) x nr. channels x window]
 
+RunningStats - accumulates the mean, std, minim and maxim over the observations chunk by chunk
+
+streamTransform - applies a transform over X chunk by chunk
+
+FeatureStdScaler - fitted featureStd transform, which can be saved and loaded with its training statistics
+
+FeatureNormScaler - fitted featureNorm / featureNormRange transform, which can be saved and loaded with its training statistics
+
+loadScaler - loads a scaler saved with FeatureStdScaler.save or FeatureNormScaler.save
+
 """
 
-def sgnNorm(X):
+def sgnNorm(X, out = None):
 	"""
 	This function transform the EEG signal space into range [0, 1] over the channels.
 
 	Input data:
-		X - EEG signals with dimension [nr. channels x nr. samples]
+		X - EEG signals with dimension [nr. channels x nr. samples] or [nr. observations x nr. channels x nr. samples]
+		out - the array where xnorm is written. It can be X itself. If None, xnorm is allocated. DEFAULT = None
 
 	Output data:
-		xnorm - Normalized X signal. Dimension: [nr. channels x nr. samples]
+		xnorm - Normalized X signal. Dimension: [nr. channels x nr. samples] or [nr. observations x nr. channels x nr. samples]
 
-	The function will compute the minim and maxim over the channels (dimension: [nr. channels x 1]) and will transform the
-	space using the minin and maxim values using equation:
+	The function will compute the minim and maxim over the samples of every channel (dimension: [nr. channels x 1] or
+	[nr. observations x nr. channels x 1]) and will transform the space using the minin and maxim values using equation:
 					X = (X - minim)/(maxim-minim)
 	"""
+	X = np.asarray(X)
 
-	dim = X.shape
-
-	minim = np.reshape(X.min(axis=1),(dim[0],1))
-	maxim = np.reshape(X.max(axis=1),(dim[0],1))
+	minim = X.min(axis=-1, keepdims=True)
+	maxim = X.max(axis=-1, keepdims=True)
 
-	xnorm = (X - numpy.matlib.repmat(minim,1,dim[1]))/numpy.matlib.repmat((maxim-minim),1,dim[1])
-
-	xnorm = np.asarray(xnorm)
+	xnorm = np.subtract(X, minim, out = out)
+	xnorm /= maxim - minim
 
 	return xnorm
 
 
-def sgnStd(X):
+def sgnStd(X, out = None):
 	"""
 	This function transform the EEG signal space having the mean 0 and std 1, over the channels.
 
 	Input data:
-		X - EEG signals with dimension [nr. channels x nr. samples]
+		X - EEG signals with dimension [nr. channels x nr. samples] or [nr. observations x nr. channels x nr. samples]
+		out - the array where xstandard is written. It can be X itself. If None, xstandard is allocated. DEFAULT = None
 
 	Output data:
-		xstandard - Standardized X signal. Dimension: [nr. channels x nr. samples]
+		xstandard - Standardized X signal. Dimension: [nr. channels x nr. samples] or [nr. observations x nr. channels x nr. samples]
 
-	The function will compute the mean and standard deviation over the channels (dimension: [nr. channels x 1]) and will transform 
-	the space using the minim and maxim values using equation:
+	The function will compute the mean and standard deviation over the samples of every channel (dimension: [nr. channels x 1]
+	or [nr. observations x nr. channels x 1]) and will transform the space using the mean and std values using equation:
 					X = (X - mean)/std
 	"""
-	dim = X.shape
-	
-	mean = np.reshape(X.mean(axis=1),(dim[0],1))
-	std = np.reshape(X.std(axis=1),(dim[0],1))
+	X = np.asarray(X)
 
-	xstandard = (X - numpy.matlib.repmat(mean,1,dim[1]))/numpy.matlib.repmat(std,1,dim[1])
+	mean = X.mean(axis=-1, keepdims=True)
+
+	xstandard = np.subtract(X, mean, out = out)
+	std = np.sqrt(np.einsum('...i,...i->...', xstandard, xstandard)/X.shape[-1])
+	xstandard /= std[...,None]
 
 	return xstandard
 
-def featureNorm(X, minim = None, maxim = None, flag = 0):
+def featureNorm(X, minim = None, maxim = None, flag = 0, dtype = np.float32, out = None):
 	"""
 	This function transform the EEG signal space into range [0, 1] over the features.
 
@@ -81,6 +93,8 @@ def featureNorm(X, minim = None, maxim = None, flag = 0):
 		[nr. channels x nr. features]
 		flag - flag takes values 0 and 1, 0 if the user don't want to return the values of minim and maxim and 1 if the user
 		wich to reurn the minim and maxim values
+		dtype - the data type of the computation and of the output. X, minim and maxim are converted to dtype. DEFAULT = np.float32
+		out - the array where xnorm is written. It can be X itself. If None, xnorm is allocated. DEFAULT = None
 
 	IMPORTANT: The function MUST receive minim AND maxim. If one is given, the other must be given too!!!
 
@@ -90,56 +104,11 @@ def featureNorm(X, minim = None, maxim = None, flag = 0):
 	The function will compute the minim and maxim over the features (dimension: [1 x nr. features] or [nr. channels x nr. features])
 	and will transform the space using the minim and maxim values using equation:
 					X = (X - minim)/(maxim-minim)
+	The statistics are broadcast over the observations, so the only array as large as X is xnorm.
 	"""
+	return featureNormRange(X, minim = minim, maxim = maxim, flag = flag, rng = None, dtype = dtype, out = out)
 
-	dim = X.shape
-
-	if ((minim is None) and not(maxim is None)) or (not(minim is None) and (maxim is None)):
-		raise AttributeError("The function MUST receive minim AND maxim. If one is given, the other must be given too!!!")
-
-	if not(minim is None) and not(maxim is None):
-		if minim.shape != maxim.shape:
-			raise AttributeError("Minim and maxim must be the same length")
-
-		if len(dim)==2:
-			if dim[1]!=minim.shape[1]:
-				raise AttributeError("X features and minim must be the same length")
-
-			if dim[1]!=maxim.shape[1]:
-				raise AttributeError("X features and maxim must be the same length")
-
-			xnorm = (X - numpy.matlib.repmat(minim,dim[0],1))/numpy.matlib.repmat((maxim-minim),dim[0],1)
-			return xnorm
-
-		if len(dim)==3:
-			if dim[1]!=minim.shape[0] or dim[2]!=minim.shape[1]:
-				raise AttributeError("X features and minim/maxim must be the same length")
-
-			xnorm = (X - minim)/(maxim-minim)
-			return xnorm
-	else:
-		if len(dim)==2:
-			minim = np.reshape(X.min(axis=0),(1,dim[1]))
-			maxim = np.reshape(X.max(axis=0),(1,dim[1]))
-
-			xnorm = (X - numpy.matlib.repmat(minim,dim[0],1))/numpy.matlib.repmat((maxim-minim),dim[0],1)
-
-		elif len(dim)==3:
-			minim = X.min(axis=0)
-			maxim = X.max(axis=0)
-
-			xnorm = (X - minim)/(maxim-minim)
-		else:
-			raise ValueError("Too many dimensions for X!")
-
-		if flag==0:
-				return xnorm
-		elif flag==1:
-			return xnorm, minim, maxim
-		else:
-			raise ValueError("It's not a valid flag value!")
-
-def featureStd(X, mean = None, std = None, flag = 0):
+def featureStd(X, mean = None, std = None, flag = 0, dtype = np.float32, out = None):
 	"""
 	This function transform the EEG signal space into a space uit mean 0 and std 1 over the features.
 
@@ -151,6 +120,8 @@ def featureStd(X, mean = None, std = None, flag = 0):
 		[nr. channels x nr. features]
 		flag - flag takes values 0 and 1, 0 if the user don't want to return the values of mean and std and 1 if the user
 		wish to return the mean and std values
+		dtype - the data type of the computation and of the output. X, mean and std are converted to dtype. DEFAULT = np.float32
+		out - the array where xstd is written. It can be X itself. If None, xstd is allocated. DEFAULT = None
 
 	IMPORTANT: The function MUST receive mean AND std. If one is given, the other must be given too!!!
 
@@ -160,8 +131,10 @@ def featureStd(X, mean = None, std = None, flag = 0):
 	The function will compute the mmean and std over the features (dimension: [1 x nr. features] or [nr. channels x nr. features])
 	and will transform the space using the mean and std values using equation:
 					X = (X - mean)/std
+	The statistics are broadcast over the observations, so the only array as large as X is xstd.
 	"""
 
+	X = np.asarray(X)
 	dim = X.shape
 
 	if ((mean is None) and not(std is None)) or (not(mean is None) and (std is None)):
@@ -171,6 +144,9 @@ def featureStd(X, mean = None, std = None, flag = 0):
 		if mean.shape != std.shape:
 			raise AttributeError("Minim and maxim must be the same length")
 
+		mean = np.asarray(mean, dtype = dtype)
+		std = np.asarray(std, dtype = dtype)
+
 		if len(dim)==2:
 			if dim[1]!=mean.shape[1]:
 				raise AttributeError("X features and mean must be the same length")
@@ -178,29 +154,25 @@ def featureStd(X, mean = None, std = None, flag = 0):
 			if dim[1]!=std.shape[1]:
 				raise AttributeError("X features and std must be the same length")
 
-			xstd = (X - numpy.matlib.repmat(mean,dim[0],1))/numpy.matlib.repmat(std,dim[0],1)
-			return xstd
-
-		if len(dim)==3:
+		elif len(dim)==3:
 			if dim[1]!=mean.shape[0] or dim[2]!=std.shape[1]:
 				raise AttributeError("X features and mean/std must be the same length")
+		else:
+			raise ValueError("Too many dimensions for X!")
 
-			xstd = (X - mean)/std
-			return xstd
+		xstd = np.subtract(X, mean, out = out, dtype = dtype)
+		xstd /= std
+		return xstd
 	else:
-		if len(dim)==2:
-			mean = np.reshape(X.mean(axis=0),(1,dim[1]))
-			std = np.reshape(X.std(axis=0),(1,dim[1]))
+		if len(dim)!=2 and len(dim)!=3:
+			raise ValueError("Too many dimensions for X!")
 
-			xstd = (X - numpy.matlib.repmat(mean,dim[0],1))/numpy.matlib.repmat(std,dim[0],1)
+		mean = X.mean(axis=0, keepdims=len(dim)==2, dtype=dtype)
 
-		elif len(dim)==3:
-			mean = X.mean(axis=0)
-			std = X.std(axis=0)
-
-			xstd = (X - mean)/std
-		else:
-			raise ValueError("Too many dimensions for X!")
+		xstd = np.subtract(X, mean, out = out, dtype = dtype)
+		std = np.sqrt(np.einsum('i...,i...->...', xstd, xstd)/dim[0])
+		std = np.reshape(std, mean.shape).astype(dtype, copy = False)
+		xstd /= std
 
 		if flag==0:
 				return xstd
@@ -221,7 +193,7 @@ def mat3d2mat2d(x):
 
 	"""
 	dim = x.shape
-	xm = np.zeros((dim[0],dim[1]*dim[2]))
+	xm = np.zeros((dim[0],dim[1]*dim[2]), dtype = x.dtype)
 	for i in range(dim[0]):
 	    xm[i,:] = np.reshape(x[i,:,:],(1,dim[1]*dim[2]))
 
@@ -239,13 +211,13 @@ def mat2d2mat3d(x,n,m):
 
 	"""
 	dim = x.shape
-	xm = np.zeros((dim[0],n,m))
+	xm = np.zeros((dim[0],n,m), dtype = x.dtype)
 	for i in range(dim[0]):
 	    xm[i,:,:] = np.reshape(x[i,:],(1,n,m))
 
 	return xm
 
-def spWin(x, window, y=None):
+def spWin(x, window, y=None, dtype = np.float32, hop = None, view = False):
 	"""
 	This function split a matrix x of dimension [nr. observations x nr. channels x nr. samples] into a matrix with dimension 
 	[nr. observations * (nr. samples/window) x nr. channels x window]
@@ -254,41 +226,46 @@ def spWin(x, window, y=None):
 		x - A 3D matrix of dimension [nr. observations x nr. channels x nr. samples]
 		window - The numbers of samples of one window
 		y - the data target, if needed
+		dtype - the data type of xsplit. Not used if view is True. DEFAULT = np.float32
+		hop - the number of samples between the starts of two consecutive windows. If hop is smaller than window, the
+			windows overlap. If None, hop = window. DEFAULT = None
+		view - if True, xsplit is a read-only view of x with dimension [nr. observations x nr. windows x nr. channels x window]
+			and nothing is copied. xsplit keeps the data type of x. DEFAULT = False
 		
 	Output data:
-		xsplit - the splited matrix x over the desired window Dimension: [nr. observations * (nr. samples/window) x nr. channels x window]
-		ysplit - only if y is provided, which contains the new target for the splitted matrix
+		xsplit - the splited matrix x over the desired window Dimension: [nr. observations * nr. windows x nr. channels x window]
+		ysplit - only if y is provided, which contains the new target for the splitted matrix. Dimension: [nr. observations * nr. windows x 1]
 
+	The number of windows of one observation is (nr. samples - window)/hop + 1. The samples after the last full window are dropped.
 	"""
 	dim = x.shape
 
-	nr_recf = int(dim[0]*(dim[2]/window))
-
-	xsplit = np.zeros((nr_recf,dim[1],window))
+	if hop is None:
+		hop = window
 
 	if not(y is None):
 		if dim[0]!=len(y):
 			raise AttributeError("The length of y must match the first dimension of x!")
-		ysplit = np.zeros((nr_recf,1))
 
-	i = 0
-	for rec,j in zip(x,range(len(x))):
-		for win in range(0,len(rec[0]),window):
-			print(win)
-			xsplit[i,:,:] = rec[:,win:win+window]
+	xwin = np.lib.stride_tricks.sliding_window_view(x, window, axis=2)[:,:,::hop,:]
+	xwin = xwin.transpose(0,2,1,3)
+	nr_win = xwin.shape[1]
 
-			if not(y is None):
-				ysplit[i,0] = y[j]
-			i+=1
+	if view:
+		xsplit = xwin
+	else:
+		xsplit = np.empty((dim[0]*nr_win,dim[1],window), dtype = dtype)
+		xsplit.reshape(xwin.shape)[...] = xwin
 
 	if not(y is None):
+		ysplit = np.repeat(np.reshape(y,(dim[0],1)), nr_win, axis=0)
 		return xsplit,ysplit
 	else:
 		return xsplit
 
-def featureNormRange(X, minim = None, maxim = None, flag = 0, rng = [-1, 1]):
+def featureNormRange(X, minim = None, maxim = None, flag = 0, rng = [-1, 1], dtype = np.float32, out = None):
 	"""
-	This function transform the EEG signal space into range [0, 1] over the features.
+	This function transform the EEG signal space into range rng over the features.
 
 	Input data:
 		X - EEG signals with dimension [nr. observations x nr. features] or [nr. observations x nr. channels x nr. features]
@@ -298,6 +275,9 @@ def featureNormRange(X, minim = None, maxim = None, flag = 0, rng = [-1, 1]):
 		[nr. channels x nr. features]
 		flag - flag takes values 0 and 1, 0 if the user don't want to return the values of minim and maxim and 1 if the user
 		wich to reurn the minim and maxim values
+		rng - the output range [low, high]. If None, the range is [0, 1]. DEFAULT = [-1, 1]
+		dtype - the data type of the computation and of the output. X, minim and maxim are converted to dtype. DEFAULT = np.float32
+		out - the array where xnorm is written. It can be X itself. If None, xnorm is allocated. DEFAULT = None
 
 	IMPORTANT: The function MUST receive minim AND maxim. If one is given, the other must be given too!!!
 
@@ -306,18 +286,25 @@ def featureNormRange(X, minim = None, maxim = None, flag = 0, rng = [-1, 1]):
 
 	The function will compute the minim and maxim over the features (dimension: [1 x nr. features] or [nr. channels x nr. features])
 	and will transform the space using the minim and maxim values using equation:
-					X = (X - minim)/(maxim-minim)
+					X = (X - minim)/(maxim-minim)*(rng[1]-rng[0]) + rng[0]
+	The statistics are broadcast over the observations, so the only array as large as X is xnorm.
 	"""
 
+	X = np.asarray(X)
 	dim = X.shape
 
 	if ((minim is None) and not(maxim is None)) or (not(minim is None) and (maxim is None)):
 		raise AttributeError("The function MUST receive minim AND maxim. If one is given, the other must be given too!!!")
 
+	fitted = False
+
 	if not(minim is None) and not(maxim is None):
 		if minim.shape != maxim.shape:
 			raise AttributeError("Minim and maxim must be the same length")
 
+		minim = np.asarray(minim, dtype = dtype)
+		maxim = np.asarray(maxim, dtype = dtype)
+
 		if len(dim)==2:
 			if dim[1]!=minim.shape[1]:
 				raise AttributeError("X features and minim must be the same length")
@@ -325,33 +312,349 @@ def featureNormRange(X, minim = None, maxim = None, flag = 0, rng = [-1, 1]):
 			if dim[1]!=maxim.shape[1]:
 				raise AttributeError("X features and maxim must be the same length")
 
-			xnorm = (X - numpy.matlib.repmat(minim,dim[0],1))/numpy.matlib.repmat((maxim-minim),dim[0],1)*(rng[1]-rng[0]) + rng[0]
-			return xnorm
-
-		if len(dim)==3:
+		elif len(dim)==3:
 			if dim[1]!=minim.shape[0] or dim[2]!=minim.shape[1]:
 				raise AttributeError("X features and minim/maxim must be the same length")
+		else:
+			raise ValueError("Too many dimensions for X!")
+	else:
+		if len(dim)!=2 and len(dim)!=3:
+			raise ValueError("Too many dimensions for X!")
+
+		if flag!=0 and flag!=1:
+			raise ValueError("It's not a valid flag value!")
+
+		fitted = True
+		minim = X.min(axis=0, keepdims=len(dim)==2).astype(dtype, copy = False)
+		maxim = X.max(axis=0, keepdims=len(dim)==2).astype(dtype, copy = False)
 
-			xnorm = (X - minim)/(maxim-minim)*(rng[1]-rng[0]) + rng[0]
-			return xnorm
+	xnorm = np.subtract(X, minim, out = out, dtype = dtype)
+	xnorm /= maxim - minim
+
+	if not(rng is None):
+		xnorm *= rng[1] - rng[0]
+		xnorm += rng[0]
+
+	if fitted and flag==1:
+		return xnorm, minim, maxim
 	else:
-		if len(dim)==2:
-			minim = np.reshape(X.min(axis=0),(1,dim[1]))
-			maxim = np.reshape(X.max(axis=0),(1,dim[1]))
+		return xnorm
 
-			xnorm = (X - numpy.matlib.repmat(minim,dim[0],1))/numpy.matlib.repmat((maxim-minim),dim[0],1)*(rng[1]-rng[0]) + rng[0]
 
-		elif len(dim)==3:
-			minim = X.min(axis=0)
-			maxim = X.max(axis=0)
+class RunningStats:
+	"""
+	This class accumulates the mean, std, minim and maxim over the observations (axis 0) chunk by chunk, so the statistics
+	of featureStd and featureNorm can be fitted on data larger than the memory.
+
+	The mean and variance are merged with the parallel algorithm of Chan et al., so the statistics of several chunks or of
+	several workers (ex. one per subject) can be fitted separately and merged after. The statistics are accumulated in
+	float64.
+
+	Example:
+		stats = RunningStats()
+		for start in range(0, len(X), 1024):
+			stats.partial_fit(X[start:start+1024])
+		mean, std = stats.std_params()
+		xstd = featureStd(X, mean = mean, std = std)
+	"""
+	def __init__(self):
+		self.n = 0
+		self.mean = None
+		self.m2 = None
+		self.minim = None
+		self.maxim = None
+
+	def partial_fit(self, X):
+		"""
+		This function adds the observations of X to the statistics
+
+		Input data:
+			X - EEG signals with dimension [nr. observations x nr. features] or [nr. observations x nr. channels x nr. features]
+
+		Output data:
+			The RunningStats object
+		"""
+		X = np.asarray(X, dtype = np.float64)
+		if len(X) == 0:
+			return self
+
+		chunk = RunningStats()
+		chunk.n = len(X)
+		chunk.mean = X.mean(axis=0)
+		chunk.m2 = ((X - chunk.mean)**2).sum(axis=0)
+		chunk.minim = X.min(axis=0)
+		chunk.maxim = X.max(axis=0)
+
+		return self.merge(chunk)
+
+	def fit(self, X, chunk = 1024):
+		"""
+		This function adds the observations of X to the statistics, chunk observations at a time
+
+		Input data:
+			X - EEG signals with dimension [nr. observations x nr. features] or [nr. observations x nr. channels x nr. features].
+				It can be a memory-mapped array
+			chunk - the number of observations read at once. DEFAULT = 1024
+
+		Output data:
+			The RunningStats object
+		"""
+		for start in range(0,len(X),chunk):
+			self.partial_fit(X[start:start+chunk])
+
+		return self
+
+	def merge(self, other):
+		"""
+		This function merges the statistics of other into this object
+
+		Input data:
+			other - a RunningStats object fitted on other observations
+
+		Output data:
+			The RunningStats object
+		"""
+		if other.n == 0:
+			return self
+
+		if self.n == 0:
+			self.n = other.n
+			self.mean = np.array(other.mean)
+			self.m2 = np.array(other.m2)
+			self.minim = np.array(other.minim)
+			self.maxim = np.array(other.maxim)
+			return self
+
+		n = self.n + other.n
+		delta = other.mean - self.mean
+
+		self.mean = self.mean + delta*(other.n/n)
+		self.m2 = self.m2 + other.m2 + delta*delta*(self.n*other.n/n)
+		self.minim = np.minimum(self.minim, other.minim)
+		self.maxim = np.maximum(self.maxim, other.maxim)
+		self.n = n
+
+		return self
+
+	def std_params(self, dtype = np.float32):
+		"""
+		This function returns the mean and std in the shape expected by featureStd
+
+		Input data:
+			dtype - the data type of mean and std. DEFAULT = np.float32
+
+		Output data:
+			mean - the mean. Dimension: [1 x nr. features] or [nr. channels x nr. features]
+			std - the standard deviation (ddof = 0, as X.std). Dimension: [1 x nr. features] or [nr. channels x nr. features]
+		"""
+		if self.n == 0:
+			raise ValueError("The statistics were not fitted!")
+
+		mean = np.asarray(self.mean, dtype = dtype)
+		std = np.asarray(np.sqrt(self.m2/self.n), dtype = dtype)
+
+		if len(mean.shape) == 1:
+			mean = np.reshape(mean,(1,len(mean)))
+			std = np.reshape(std,(1,len(std)))
+
+		return mean, std
+
+	def norm_params(self, dtype = np.float32):
+		"""
+		This function returns the minim and maxim in the shape expected by featureNorm and featureNormRange
+
+		Input data:
+			dtype - the data type of minim and maxim. DEFAULT = np.float32
+
+		Output data:
+			minim - the minim. Dimension: [1 x nr. features] or [nr. channels x nr. features]
+			maxim - the maxim. Dimension: [1 x nr. features] or [nr. channels x nr. features]
+		"""
+		if self.n == 0:
+			raise ValueError("The statistics were not fitted!")
+
+		minim = np.asarray(self.minim, dtype = dtype)
+		maxim = np.asarray(self.maxim, dtype = dtype)
+
+		if len(minim.shape) == 1:
+			minim = np.reshape(minim,(1,len(minim)))
+			maxim = np.reshape(maxim,(1,len(maxim)))
+
+		return minim, maxim
 
-			xnorm = (X - minim)/(maxim-minim)*(rng[1]-rng[0]) + rng[0]
-		else:
-			raise ValueError("Too many dimensions for X!")
+def streamTransform(X, transform, out = None, chunk = 1024):
+	"""
+	This function applies a transform over X chunk by chunk
 
-		if flag==0:
-			return xnorm
-		elif flag==1:
-			return xnorm, minim, maxim
+	Input data:
+		X - EEG signals with dimension [nr. observations x ...]. It can be a memory-mapped array
+		transform - the function applied on every chunk, ex. lambda x: featureStd(x, mean = mean, std = std)
+		out - the array where the result is written, ex. a np.lib.format.open_memmap array. If None, the result is
+			allocated in memory. DEFAULT = None
+		chunk - the number of observations transformed at once. DEFAULT = 1024
+
+	Output data:
+		out - the transformed X
+	"""
+	for start in range(0,len(X),chunk):
+		xt = transform(X[start:start+chunk])
+
+		if out is None:
+			out = np.empty((len(X),) + xt.shape[1:], dtype = xt.dtype)
+
+		out[start:start+len(xt)] = xt
+
+	return out
+
+
+class FeatureStdScaler:
+	"""
+	This class is the fitted featureStd transform. It keeps the training statistics, so the test data and the data seen
+	at inference are standardized exactly as the training data, without reloading it.
+
+	Input data:
+		dtype - the data type of the statistics and of the transformed data. DEFAULT = np.float32
+
+	Example:
+		scaler = FeatureStdScaler().fit(xtrain)
+		xtrain = scaler.transform(xtrain)
+		xtest = scaler.transform(xtest)
+		scaler.save('scaler.npz')
+		...
+		xnew = loadScaler('scaler.npz').transform(xnew)
+	"""
+	kind = 'std'
+	rng = None
+
+	def __init__(self, dtype = np.float32):
+		self.dtype = np.dtype(dtype)
+		self.stats = RunningStats()
+
+	def partial_fit(self, X):
+		"""
+		This function adds the observations of X to the fitted statistics
+
+		Input data:
+			X - EEG signals with dimension [nr. observations x nr. features] or [nr. observations x nr. channels x nr. features]
+
+		Output data:
+			The scaler
+		"""
+		self.stats.partial_fit(X)
+		return self
+
+	def fit(self, X, chunk = 1024):
+		"""
+		This function fits the statistics on X, chunk observations at a time. The previous statistics are discarded.
+
+		Input data:
+			X - EEG signals with dimension [nr. observations x nr. features] or [nr. observations x nr. channels x nr. features].
+				It can be a memory-mapped array
+			chunk - the number of observations read at once. DEFAULT = 1024
+
+		Output data:
+			The scaler
+		"""
+		self.stats = RunningStats().fit(X, chunk)
+		return self
+
+	def params(self):
+		"""
+		This function returns the mean and std used by transform (see RunningStats.std_params)
+		"""
+		return self.stats.std_params(self.dtype)
+
+	def transform(self, X, out = None):
+		"""
+		This function standardizes X with the fitted statistics (see featureStd)
+
+		Input data:
+			X - EEG signals with dimension [nr. observations x nr. features] or [nr. observations x nr. channels x nr. features]
+			out - the array where the result is written. If None, it is allocated. DEFAULT = None
+
+		Output data:
+			The standardized X
+		"""
+		mean, std = self.params()
+		return featureStd(X, mean = mean, std = std, dtype = self.dtype, out = out)
+
+	def fit_transform(self, X, out = None):
+		"""
+		This function fits the statistics on X and standardizes X
+		"""
+		return self.fit(X).transform(X, out = out)
+
+	def save(self, filename):
+		"""
+		This function saves the scaler into a .npz file, which can be loaded with loadScaler
+
+		Input data:
+			filename - the name of the .npz file
+		"""
+		if self.stats.n == 0:
+			raise ValueError("The statistics were not fitted!")
+
+		np.savez(filename, kind = self.kind, dtype = str(self.dtype), rng = np.asarray([] if self.rng is None else self.rng, dtype = float),
+			n = self.stats.n, mean = self.stats.mean, m2 = self.stats.m2, minim = self.stats.minim, maxim = self.stats.maxim)
+
+class FeatureNormScaler(FeatureStdScaler):
+	"""
+	This class is the fitted featureNorm / featureNormRange transform. It keeps the training statistics, so the test data
+	and the data seen at inference are normalized exactly as the training data, without reloading it.
+
+	Input data:
+		rng - the output range [low, high]. If None, the range is [0, 1] as for featureNorm. DEFAULT = None
+		dtype - the data type of the statistics and of the transformed data. DEFAULT = np.float32
+	"""
+	kind = 'norm'
+
+	def __init__(self, rng = None, dtype = np.float32):
+		FeatureStdScaler.__init__(self, dtype)
+		self.rng = None if rng is None else list(rng)
+
+	def params(self):
+		"""
+		This function returns the minim and maxim used by transform (see RunningStats.norm_params)
+		"""
+		return self.stats.norm_params(self.dtype)
+
+	def transform(self, X, out = None):
+		"""
+		This function normalizes X with the fitted statistics (see featureNormRange)
+
+		Input data:
+			X - EEG signals with dimension [nr. observations x nr. features] or [nr. observations x nr. channels x nr. features]
+			out - the array where the result is written. If None, it is allocated. DEFAULT = None
+
+		Output data:
+			The normalized X
+		"""
+		minim, maxim = self.params()
+		return featureNormRange(X, minim = minim, maxim = maxim, rng = self.rng, dtype = self.dtype, out = out)
+
+def loadScaler(filename):
+	"""
+	This function loads a scaler saved with FeatureStdScaler.save or FeatureNormScaler.save
+
+	Input data:
+		filename - the name of the .npz file
+
+	Output data:
+		The FeatureStdScaler or FeatureNormScaler object. It can be fitted further with partial_fit.
+	"""
+	with np.load(filename) as data:
+		if str(data['kind']) == 'std':
+			scaler = FeatureStdScaler(dtype = str(data['dtype']))
+		elif str(data['kind']) == 'norm':
+			rng = list(data['rng']) if len(data['rng']) else None
+			scaler = FeatureNormScaler(rng = rng, dtype = str(data['dtype']))
 		else:
-			raise ValueError("It's not a valid flag value!")
\ No newline at end of file
+			raise ValueError("It's not a valid scaler file!")
+
+		scaler.stats.n = int(data['n'])
+		scaler.stats.mean = data['mean']
+		scaler.stats.m2 = data['m2']
+		scaler.stats.minim = data['minim']
+		scaler.stats.maxim = data['maxim']
+
+	return scaler
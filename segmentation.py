@@ -2,27 +2,123 @@ import os
 import mne
 import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 
-def data_segmentation(base_data_path, subjects, data_evidence):
-	for sub in range(len(subjects)):
-		subject = subjects[sub]
-		path = base_data_path + '\\' + subject
+"""
+This segmentation module contains:
 
-		text_file = [f for f in os.listdir(path) if f.endswith('.cnt')]
-		filename_record = path + '\\' + text_file[0]
-		data = mne.io.read_raw_cnt(filename_record, eog = ['VEO','HEO'], ecg = ['EKG'], emg = ['EMG'], preload = True)
-		data.notch_filter(np.array((60,120,180,240)))
+data_segmentation - split the continuous .cnt recording of every subject into trials
 
+segment_subject - split the continuous .cnt recording of one subject into trials
+
+save_segment_store - write all the trials of one subject into a single .npz store
+
+"""
+
+def save_segment_store(filename, data, starts, stops, tags):
+	"""
+	This function write all the trials of one subject into a single .npz store. The notch filtered signal is sliced once
+	and the trials are concatenated over the samples axis.
+
+	Input data:
+		filename - the name of the .npz store
+		data - the preloaded mne Raw object of the subject
+		starts - the start time of every trial, in seconds
+		stops - the stop time of every trial, in seconds
+		tags - the tag of every trial
+
+	Output data:
+		The .npz store will be saved with the keys:
+			samples - the concatenated trials. Dimension: [nr. channels x nr. samples of all trials]
+			index - the [start, stop, tag] of every trial in samples. Dimension: [nr. trials x 3]
+			ch_names - the channels names
+			sfreq - the sample frequency
+
+	The start and stop samples are computed the same way as mne Raw.save(tmin, tmax), so the trials are identical to the
+	ones from the .raw.fif files.
+	"""
+	sfreq = data.info['sfreq']
+	sgn = data.get_data()
+
+	start = np.floor(np.asarray(starts)*sfreq).astype(int)
+	stop = np.minimum(np.round(np.asarray(stops)*sfreq).astype(int) + 1, sgn.shape[1])
+
+	offsets = np.concatenate(([0], np.cumsum(stop - start)))
+	samples = np.concatenate([sgn[:,b:e] for b,e in zip(start, stop)], axis=1)
+	index = np.stack((offsets[:-1], offsets[1:], np.asarray(tags, dtype=int)), axis=1)
+
+	np.savez(filename, samples = samples, index = index, ch_names = np.asarray(data.ch_names), sfreq = sfreq)
+
+def segment_subject(base_data_path, subject, subject_df, save_path, output = 'fif'):
+	"""
+	This function split the continuous .cnt recording of one subject into trials
+
+	Input data:
+		base_data_path - the path of the KaraOne DataBase, containing one folder per subject
+		subject - the subject name (ex. 'MM05')
+		subject_df - the evidence table of the subject, only with the valid trials. Must contain the columns
+			subject + '_start', subject + '_stop' and subject + '_tag'
+		save_path - the folder where the trials will be written
+		output - 'fif' or 'npz'. If output is 'fif', every trial is saved in its own .raw.fif file. If output is 'npz', all
+			the trials are saved in one imagined_speech_<subject>.npz store (see save_segment_store). DEFAULT = 'fif'
+
+	Output data:
+		The number of trials written for the subject
+	"""
+	if output != 'fif' and output != 'npz':
+		raise ValueError("It's not a valid output format!")
+
+	path = os.path.join(base_data_path, subject)
+
+	text_file = [f for f in os.listdir(path) if f.endswith('.cnt')]
+	filename_record = os.path.join(path, text_file[0])
+	data = mne.io.read_raw_cnt(filename_record, eog = ['VEO','HEO'], ecg = ['EKG'], emg = ['EMG'], preload = True)
+	data.notch_filter(np.array((60,120,180,240)))
+
+	if output == 'npz':
+		save_segment_store(os.path.join(save_path, 'imagined_speech_' + subject + '.npz'), data,
+			subject_df[subject + '_start'].values/1000, subject_df[subject + '_stop'].values/1000, subject_df[subject + '_tag'].values)
+		return len(subject_df)
+
+	for i in range(0,len(subject_df)):
+		filename = 'imagined_speech_' + subject + '_%02d' % i + '_tag' + str(subject_df[subject + '_tag'][i]) + '.raw.fif'
+		data.save(os.path.join(save_path, filename), tmin = subject_df[subject + '_start'][i]/1000,
+			tmax = subject_df[subject + '_stop'][i]/1000, overwrite = True)
+
+	return len(subject_df)
+
+def data_segmentation(base_data_path, subjects, data_evidence, save_path = None, n_jobs = 1, output = 'fif'):
+	"""
+	This function split the continuous .cnt recording of every subject into trials
+
+	Input data:
+		base_data_path - the path of the KaraOne DataBase, containing one folder per subject
+		subjects - the list of the subjects names
+		data_evidence - the evidence table (pandas DataFrame) with the start, stop, tag and validity columns of every subject
+		save_path - the folder where the trials will be written. If None, the current folder is used. DEFAULT = None
+		n_jobs - the number of worker processes. Every subject is segmented in its own process. If n_jobs is 1, the
+			subjects are segmented one after another in the current process. DEFAULT = 1
+		output - 'fif' for one .raw.fif file per trial or 'npz' for one store per subject. DEFAULT = 'fif'
+
+	Output data:
+		The number of trials written for every subject
+	"""
+	if save_path is None:
+		save_path = os.getcwd()
+
+	if not os.path.isdir(save_path):
+		os.makedirs(save_path)
+
+	subjects_df = []
+	for subject in subjects:
 		subject_df = data_evidence[[col for col in data_evidence if col.startswith(subject)]]
 		subject_df = subject_df.loc[subject_df[subject_df.columns[-1]] == 1]
-		subject_df = subject_df.reset_index(drop=True)
-
-		for i in range(0,len(subject_df)):
-		    if i<10:
-		        filename = 'imagined_speech_' + subject + '_0' + str(i) + '_tag' + str(subject_df[subject + '_tag'][i]) + '.raw.fif'
-		    else:
-		        filename = 'imagined_speech_' + subject + '_' + str(i)  + '_tag' + str(subject_df[subject + '_tag'][i]) + '.raw.fif'
-		    
-		    os.chdir(r'C:\Doctorat\GANImagSpeech\DataBase')
-		    imagined_speech = data.save(filename, tmin = subject_df[subject + '_start'][i]/1000, tmax = subject_df[subject + '_stop'][i]/1000)
-	    
\ No newline at end of file
+		subjects_df.append(subject_df.reset_index(drop=True))
+
+	if n_jobs == 1:
+		return [segment_subject(base_data_path, subject, subject_df, save_path, output) for subject, subject_df in zip(subjects, subjects_df)]
+
+	with ProcessPoolExecutor(max_workers = n_jobs) as executor:
+		futures = [executor.submit(segment_subject, base_data_path, subject, subject_df, save_path, output)
+			for subject, subject_df in zip(subjects, subjects_df)]
+		return [future.result() for future in futures]
@@ -0,0 +1,174 @@
+import os
+import csv
+import json
+import time
+import argparse
+import itertools
+import numpy as np
+from FileUtils import load_data
+from pipeline import run_pipeline
+from pipeline import worker_pool
+
+"""
+This sweep module runs a grid or random search over the CGAN hyperparameters, with one trial per worker process:
+
+	python sweep.py pipeline_config.json [--n_jobs N] [--threads N]
+
+The pipeline is run until the standardize stage, then every trial trains the CGAN on the standardized features with
+one combination of the values of the "sweep" section of the config file:
+
+	"sweep": {
+		"search": "grid" or "random",
+		"n_trials": the number of random combinations,
+		"seed": the seed of the random search,
+		"n_epochs": the number of epochs of every trial,
+		"space": {"conv_layers": [[64, 64], [128, 128]], "dropout": [0.2, 0.4], "fact_fnc": ["relu"], "loss": ["mse"],
+			"latent_dim": [100, 1000], "n_batch": [64, 128], "lr": [0.0002, 0.001], "stem": ["dense", "lowrank"]}
+	}
+
+The workers read the features memory-mapped, so the pages are shared by all of them, and the number of TensorFlow
+and BLAS threads of every worker is limited to --threads (see pipeline.worker_pool), so n_jobs workers do not
+oversubscribe the CPU. The logs of
+every trial are saved in <work_dir>/sweep/ and the results of all the trials in <work_dir>/sweep/sweep_results.csv.
+
+This module contains:
+
+sweep_params - generates the hyperparameter combinations of a grid or random search
+
+init_worker - loads the features in a worker process
+
+run_trial - trains and evaluates the CGAN with one hyperparameter combination
+
+run_sweep - runs all the trials in parallel worker processes
+
+"""
+
+# the hyperparameters used when they are not in the sweep space
+DEFAULTS = {'conv_layers': [128, 128], 'dropout': 0.4, 'fact_fnc': 'relu', 'loss': 'mse', 'latent_dim': 1000,
+	'n_batch': 128, 'lr': 0.0002}
+
+# the hyperparameters passed to CGAN.define_generator, when they are in the sweep space
+GENERATOR_PARAMS = ['base_channels', 'seed_size', 'stem', 'rank', 'out_kernel']
+
+# the features of the worker process, loaded by init_worker
+_data = {}
+
+def sweep_params(space, search = 'grid', n_trials = 10, seed = 0):
+	"""
+	This function generates the hyperparameter combinations of a grid or random search
+
+	Input data:
+		space - dictionary with the list of values of every hyperparameter
+		search - 'grid' for all the combinations, 'random' for n_trials random combinations. DEFAULT = 'grid'
+		n_trials - the number of random combinations. DEFAULT = 10
+		seed - the seed of the random search. DEFAULT = 0
+
+	Output data:
+		The list of dictionaries with the value of every hyperparameter (DEFAULTS for the ones not in space)
+	"""
+	names = sorted(space)
+
+	if search == 'grid':
+		combinations = list(itertools.product(*[space[name] for name in names]))
+	elif search == 'random':
+		rng = np.random.default_rng(seed)
+		combinations = [[space[name][rng.integers(len(space[name]))] for name in names] for i in range(n_trials)]
+	else:
+		raise ValueError("Unknown search: %s" % search)
+
+	return [dict(DEFAULTS, **dict(zip(names, values))) for values in combinations]
+
+def init_worker(input_dir):
+	"""
+	This function loads the features in a worker process
+
+	Input data:
+		input_dir - the folder of the standardized features
+	"""
+	_data['train'] = load_data('xtrain.npy', 'ytrain.npy', path = input_dir, mmap_mode = 'r')
+	_data['test'] = load_data('xtest.npy', 'ytest.npy', path = input_dir, mmap_mode = 'r')
+
+def run_trial(trial, params, n_epochs, out_dir):
+	"""
+	This function trains and evaluates the CGAN with one hyperparameter combination
+
+	Input data:
+		trial - the number of the trial
+		params - the hyperparameters (see DEFAULTS)
+		n_epochs - the number of epochs
+		out_dir - the folder where the log of the trial is saved
+
+	Output data:
+		A dictionary with the trial, the hyperparameters, the last epoch losses and accuracies and the training time
+	"""
+	import CGAN
+
+	xtrain, ytrain = _data['train']
+	xtest, ytest = _data['test']
+	dim = xtrain.shape
+
+	d_model = CGAN.define_discriminator(in_shape=(dim[1],dim[2],1), conv_layers = params['conv_layers'],
+		dropout = params['dropout'], fact_fnc = params['fact_fnc'], loss = params['loss'], lr = params['lr'])
+	g_model = CGAN.define_generator(params['latent_dim'], out_size = (dim[1],dim[2]),
+		**{name: params[name] for name in GENERATOR_PARAMS if name in params})
+	gan_model = CGAN.define_gan(g_model, d_model, loss = params['loss'], lr = params['lr'])
+
+	# the real batches are read from the shared memory-mapped features, not copied in a tf.data pipeline
+	start = time.time()
+	history, thistory, history_batch = CGAN.train(g_model, d_model, gan_model, [xtrain, ytrain], params['latent_dim'],
+		[xtest, ytest], n_epochs = n_epochs, n_batch = params['n_batch'], use_tfdata = False, eval_every = n_epochs,
+		log_file = os.path.join(out_dir, 'trial_%03d.jsonl' % trial))
+
+	result = {'trial': trial}
+	result.update({name: json.dumps(value) if isinstance(value, list) else value for name, value in params.items()})
+	result.update({'train_loss': history[0][-1], 'train_acc': history[1][-1], 'test_loss': thistory[0][-1],
+		'test_acc': thistory[1][-1], 'time': time.time() - start})
+	return result
+
+def run_sweep(cfg, n_jobs = 1, threads = 1):
+	"""
+	This function runs all the trials in parallel worker processes
+
+	Input data:
+		cfg - the pipeline config, with the sweep section (see pipeline_config.json)
+		n_jobs - the number of worker processes. DEFAULT = 1
+		threads - the number of TensorFlow and BLAS threads of every worker. DEFAULT = 1
+
+	Output data:
+		The list with the results of every trial (see run_trial), sorted by the test accuracy. The results are also saved
+		in sweep_results.csv
+	"""
+	p = cfg['sweep']
+	dirs = run_pipeline(cfg, until = 'standardize')
+
+	out_dir = os.path.join(cfg.get('work_dir', 'pipeline_out'), 'sweep')
+	if not os.path.isdir(out_dir):
+		os.makedirs(out_dir)
+
+	trials = sweep_params(p['space'], p.get('search', 'grid'), p.get('n_trials', 10), p.get('seed', 0))
+
+	with worker_pool(n_jobs, threads, init_worker, (dirs['standardize'],)) as executor:
+		futures = [executor.submit(run_trial, trial, params, p.get('n_epochs', 10), out_dir) for trial, params in enumerate(trials)]
+		results = [future.result() for future in futures]
+
+	results = sorted(results, key = lambda result: -result['test_acc'])
+
+	with open(os.path.join(out_dir, 'sweep_results.csv'), 'w', newline = '') as f:
+		writer = csv.DictWriter(f, fieldnames = list(results[0].keys()))
+		writer.writeheader()
+		writer.writerows(results)
+
+	return results
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = 'Run a grid or random search over the CGAN hyperparameters.')
+	parser.add_argument('config', help = 'the JSON config file')
+	parser.add_argument('--n_jobs', type = int, default = 1, help = 'the number of worker processes')
+	parser.add_argument('--threads', type = int, default = 1, help = 'the number of threads of every worker')
+	args = parser.parse_args()
+
+	with open(args.config) as f:
+		cfg = json.load(f)
+
+	for result in run_sweep(cfg, args.n_jobs, args.threads):
+		print(result)
@@ -0,0 +1,90 @@
+import os
+import glob
+import numpy as np
+import tensorflow as tf
+
+"""
+This trainCheckpoint module contains:
+
+TrainCheckpoint - saves and restores the state of a training run: the TensorFlow objects (models, optimizers, random
+	generators, data iterators) and the NumPy state (counters, history, NumPy random generator)
+
+"""
+
+class TrainCheckpoint:
+	"""
+	This class saves and restores the state of a training run
+
+	Input data:
+		directory - the folder of the checkpoints
+		max_to_keep - the number of checkpoints kept, the older ones are deleted. DEFAULT = 3
+		objects - the TensorFlow objects saved in the checkpoint, ex. generator = g_model, d_optimizer = d_model.optimizer
+
+	Checkpoint N is saved as the TensorFlow checkpoint ckpt-N and the NumPy file ckpt-N.npz, which is written first, in a
+	temporary file renamed when complete. The TensorFlow checkpoint is only listed as the latest one when it is complete,
+	so after a crash the last complete checkpoint and its ckpt-N.npz are restored.
+
+	Example:
+		ckpt = TrainCheckpoint('checkpoints', generator = g_model, discriminator = d_model)
+		state = ckpt.restore()
+		...
+		ckpt.save(epoch, history = history)
+	"""
+	def __init__(self, directory, max_to_keep = 3, **objects):
+		self.directory = directory
+		self.checkpoint = tf.train.Checkpoint(**objects)
+		self.manager = tf.train.CheckpointManager(self.checkpoint, directory, max_to_keep = max_to_keep)
+
+	def save(self, number, **arrays):
+		"""
+		This function saves the checkpoint number
+
+		Input data:
+			number - the checkpoint number, ex. the number of finished epochs
+			arrays - the NumPy arrays and values saved in ckpt-<number>.npz
+
+		Output data:
+			The prefix of the saved checkpoint
+		"""
+		if not os.path.isdir(self.directory):
+			os.makedirs(self.directory)
+
+		# the state of the NumPy global random generator, used by the NumPy sampling functions
+		name, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+		sidecar = os.path.join(self.directory, 'ckpt-%d.npz' % number)
+		tmp = sidecar[:-4] + '.tmp.npz'
+		np.savez(tmp, np_random_keys = keys, np_random_pos = pos, np_random_has_gauss = has_gauss,
+			np_random_cached_gaussian = cached_gaussian, **arrays)
+		os.replace(tmp, sidecar)
+
+		prefix = self.manager.save(checkpoint_number = number)
+
+		# delete the NumPy files of the checkpoints deleted by the manager
+		kept = [c + '.npz' for c in self.manager.checkpoints]
+		for f in glob.glob(os.path.join(self.directory, 'ckpt-*.npz')):
+			if not f in kept and not f.endswith('.tmp.npz'):
+				os.remove(f)
+
+		return prefix
+
+	def restore(self):
+		"""
+		This function restores the latest checkpoint, if there is one
+
+		Output data:
+			A dictionary with the arrays saved with the checkpoint, or None if there is no checkpoint. The TensorFlow
+			objects and the NumPy global random generator are restored in place.
+		"""
+		latest = self.manager.latest_checkpoint
+		if latest is None:
+			return None
+
+		self.checkpoint.restore(latest)
+
+		with np.load(latest + '.npz') as data:
+			state = {name: data[name] for name in data.files}
+
+		np.random.set_state(('MT19937', state.pop('np_random_keys'), int(state.pop('np_random_pos')),
+			int(state.pop('np_random_has_gauss')), float(state.pop('np_random_cached_gaussian'))))
+
+		return state
@@ -0,0 +1,245 @@
+import os
+import csv
+import json
+import queue
+import threading
+import time
+import numpy as np
+
+def truncate_log(filename, epoch, fmt = 'jsonl'):
+	"""
+	This function removes the rows of the epochs after epoch from a JSON lines or CSV log file, ex. the rows written after
+	the last checkpoint by a run that crashed. The file is truncated in place, so a writer that appends to it is not
+	affected. A last row without its end of line, cut by a crash, is removed too.
+
+	Input data:
+		filename - the log file, with an "epoch" field (JSON lines) or an epoch first column (CSV, after the header)
+		epoch - the last kept epoch (1 for the first one), 0 removes all the rows
+		fmt - the file format: 'jsonl' or 'csv'. DEFAULT = 'jsonl'
+	"""
+	if not os.path.isfile(filename):
+		return
+
+	with open(filename, 'r+', newline = '') as f:
+		lines = [line for line in f.readlines() if line.endswith('\n')]
+		if fmt == 'csv':
+			keep = lines[:1] + [line for line in lines[1:] if int(line.split(',', 1)[0]) <= epoch]
+		else:
+			keep = [line for line in lines if json.loads(line)['epoch'] <= epoch]
+		f.seek(0)
+		f.writelines(keep)
+		f.truncate()
+
+"""
+This trainMetrics module contains:
+
+MetricsRecorder - records the losses and timings of every training step and writes them to a file in a background thread
+
+truncate_log - removes the rows of the epochs after a given epoch from a JSON lines or CSV log file
+
+"""
+
+class MetricsRecorder:
+	"""
+	This class records the losses and timings of every training step and writes them to a file in a background thread
+
+	Input data:
+		n_epochs - the number of epochs
+		bat_per_epo - the number of steps (batches) per epoch
+		n_batch - the number of samples per step, used for the throughput
+		filename - the file where the steps are written. If None, the steps are only kept in memory. DEFAULT = None
+		fmt - the file format: 'jsonl', 'csv' or 'tensorboard' (filename is then the log folder). DEFAULT = 'jsonl'
+		flush_every - the number of steps sent at once to the writer thread. DEFAULT = 100
+
+	The metrics are stored in arrays of dimension [nr. epochs x nr. steps per epoch], allocated once, so recording one
+	step is a few array assignments. The rows are formatted and written by the writer thread, never in the training loop.
+
+	Example:
+		recorder = MetricsRecorder(n_epochs, bat_per_epo, n_batch, 'steps.jsonl')
+		recorder.start()
+		...
+		recorder.record(i, j, d_loss1, d_loss2, g_loss, acc)
+		recorder.close()
+	"""
+	FIELDS = ['d_loss1', 'd_loss2', 'g_loss', 'acc', 'step_time']
+
+	def __init__(self, n_epochs, bat_per_epo, n_batch, filename = None, fmt = 'jsonl', flush_every = 100):
+		if not fmt in ['jsonl', 'csv', 'tensorboard']:
+			raise ValueError("Unknown metrics format: %s" % fmt)
+
+		self.n_batch = n_batch
+		self.bat_per_epo = bat_per_epo
+		self.filename = filename
+		self.fmt = fmt
+		self.flush_every = flush_every
+		self.metrics = {name: np.full((n_epochs, bat_per_epo), np.nan) for name in self.FIELDS}
+		self.step_start = 0.0
+		self.pending = 0
+		self.last = 0
+
+		self.queue = None
+		self.thread = None
+		if not(filename is None):
+			self.queue = queue.Queue()
+			self.thread = threading.Thread(target = self._writer, daemon = True)
+			self.thread.start()
+
+	def start(self):
+		"""
+		This function marks the start of a training step
+		"""
+		self.step_start = time.perf_counter()
+
+	def record(self, i, j, d_loss1, d_loss2, g_loss, acc):
+		"""
+		This function records the metrics of the training step j of the epoch i
+
+		Input data:
+			i - the epoch
+			j - the step in the epoch
+			d_loss1 - the discriminator loss on the 'real' samples
+			d_loss2 - the discriminator loss on the 'fake' samples
+			g_loss - the generator loss
+			acc - the accuracy of the discriminator on the generated samples
+		"""
+		m = self.metrics
+		m['step_time'][i,j] = time.perf_counter() - self.step_start
+		m['d_loss1'][i,j] = d_loss1
+		m['d_loss2'][i,j] = d_loss2
+		m['g_loss'][i,j] = g_loss
+		m['acc'][i,j] = acc
+
+		self.pending += 1
+		if self.pending >= self.flush_every:
+			self.flush()
+
+	def flush(self, wait = False):
+		"""
+		This function sends the steps recorded since the last flush to the writer thread
+
+		Input data:
+			wait - if True, returns when the writer thread has written all the steps, ex. before a checkpoint. DEFAULT = False
+		"""
+		n = self.last + self.pending
+		if not(self.queue is None) and self.pending > 0:
+			steps = np.arange(self.last, n)
+			epochs, batches = np.divmod(steps, self.bat_per_epo)
+			rows = np.stack([self.metrics[name][epochs, batches] for name in self.FIELDS], axis = 1)
+			self.queue.put((epochs, batches, rows))
+		self.last = n
+		self.pending = 0
+		if wait and not(self.queue is None):
+			self.queue.join()
+
+	def epoch_summary(self, i):
+		"""
+		This function returns the mean metrics of the epoch i
+
+		Output data:
+			A dictionary with the mean losses, accuracy and step time and the throughput in samples per second
+		"""
+		summary = {name: float(np.nanmean(self.metrics[name][i])) for name in self.FIELDS}
+		summary['samples_per_s'] = self.n_batch / summary['step_time']
+		return summary
+
+	def history_batch(self):
+		"""
+		This function returns the generator loss and accuracy of every step
+
+		Output data:
+			The array of dimension [2 x nr. steps per epoch x nr. epochs]
+		"""
+		return np.stack([self.metrics['g_loss'].T, self.metrics['acc'].T])
+
+	def state(self):
+		"""
+		This function returns the recorded metrics, to be saved in a checkpoint
+
+		Output data:
+			A dictionary with the array of every metric, named metrics_<name>
+		"""
+		return {'metrics_' + name: self.metrics[name] for name in self.FIELDS}
+
+	def load_state(self, state, epoch):
+		"""
+		This function restores the metrics saved in a checkpoint, the recording continues with the epoch
+
+		Input data:
+			state - the dictionary returned by state
+			epoch - the first epoch that is recorded again
+		"""
+		for name in self.FIELDS:
+			if state['metrics_' + name].shape != self.metrics[name].shape:
+				raise ValueError("The checkpoint metrics have the shape %s, not (n_epochs, steps per epoch) = %s" %
+					(state['metrics_' + name].shape, self.metrics[name].shape))
+		for name in self.FIELDS:
+			self.metrics[name][:] = state['metrics_' + name]
+		self.last = epoch * self.bat_per_epo
+		self.pending = 0
+
+	def truncate(self, epoch):
+		"""
+		This function removes the steps of the epochs after epoch from the file, ex. the steps written after the last
+		checkpoint by a run that crashed, which are recorded again. The TensorBoard logs are not changed.
+
+		Input data:
+			epoch - the last kept epoch (1 for the first one), 0 removes all the steps
+		"""
+		if not(self.filename is None) and self.fmt != 'tensorboard':
+			truncate_log(self.filename, epoch, self.fmt)
+
+	def close(self):
+		"""
+		This function writes the remaining steps and stops the writer thread
+		"""
+		self.flush()
+		if not(self.thread is None):
+			self.queue.put(None)
+			self.thread.join()
+			self.thread = None
+
+	def _writer(self):
+		# runs in the writer thread: formats and appends the rows sent by flush
+		if self.fmt == 'tensorboard':
+			import tensorflow as tf
+			writer = tf.summary.create_file_writer(self.filename)
+		else:
+			folder = os.path.dirname(self.filename)
+			if folder and not os.path.isdir(folder):
+				os.makedirs(folder)
+			new = not os.path.isfile(self.filename)
+			f = open(self.filename, 'a', newline = '')
+			if self.fmt == 'csv':
+				writer = csv.writer(f)
+				if new:
+					writer.writerow(['epoch', 'step'] + self.FIELDS + ['samples_per_s'])
+
+		while True:
+			item = self.queue.get()
+			if item is None:
+				self.queue.task_done()
+				break
+			epochs, batches, rows = item
+			throughput = self.n_batch / rows[:,-1]
+
+			if self.fmt == 'tensorboard':
+				with writer.as_default():
+					for k in range(len(rows)):
+						step = int(epochs[k] * self.bat_per_epo + batches[k])
+						for name, value in zip(self.FIELDS, rows[k]):
+							tf.summary.scalar(name, value, step = step)
+						tf.summary.scalar('samples_per_s', throughput[k], step = step)
+				writer.flush()
+			elif self.fmt == 'csv':
+				writer.writerows([[int(epochs[k]) + 1, int(batches[k]) + 1] + rows[k].tolist() + [throughput[k]] for k in range(len(rows))])
+				f.flush()
+			else:
+				f.writelines(json.dumps(dict(epoch = int(epochs[k]) + 1, step = int(batches[k]) + 1, samples_per_s = throughput[k],
+					**dict(zip(self.FIELDS, rows[k].tolist())))) + '\n' for k in range(len(rows)))
+				f.flush()
+			self.queue.task_done()
+
+		if self.fmt == 'tensorboard':
+			writer.close()
+		else:
+			f.close()